@@ -4,7 +4,7 @@ import { useLocalSearchParams, router } from 'expo-router';
 import { AlertModal } from './components/AlertModal';
 import { useAuth } from './contexts/AuthContext';
 import socketService from './services/socket';
-import { calculateReward, updateUserCoins, getUserCoins } from './services/rewards';
+import { calculateReward, finishSession, getUserCoins } from './services/rewards';
 import { theme } from './theme/colors';
 
 export default function FocusScreen() {
@@ -17,6 +17,7 @@ export default function FocusScreen() {
     const mode = params.mode as string;
     const partnerId = params.partnerId as string;
     const partnerUsername = params.partnerUsername as string;
+    const [sessionKey] = useState(() => `${Date.now()}-${Math.random().toString(36).slice(2)}`);
     const [alertConfig, setAlertConfig] = useState<{
         visible: boolean;
         title: string;
@@ -61,9 +62,7 @@ export default function FocusScreen() {
         if (mode === 'buddy' && partnerId) {
             socketService.connect();
 
-            socketService.startMatching(0, '', {
-                onMatch: () => { },
-                onTimeout: () => { },
+            socketService.watchSession({
                 onPartnerLeave: () => {
                     if (!partnerCompleted && !hasCompleted) {
                         console.log('onPartnerLeave triggered. partnerCompleted not true');
@@ -146,7 +145,7 @@ export default function FocusScreen() {
 
     const handleCompletion = async () => {
         setHasCompleted(true);
-        const reward = calculateReward(
+        let reward = calculateReward(
             totalTime,
             mode === 'buddy',
             true,
@@ -155,27 +154,16 @@ export default function FocusScreen() {
 
         try {
             if (token) {
-                const updatedCoins = await updateUserCoins(token, reward.points);
-                setCoins(updatedCoins);
-
-                await fetch('http://localhost:5000/api/focus/complete', {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json',
-                        'Authorization': `Bearer ${token}`
-                    },
-                    body: JSON.stringify({
-                        focusTime: totalTime / 60
-                    })
-                });
-
-                const statsResponse = await fetch('http://localhost:5000/api/user/stats', {
-                    headers: {
-                        'Authorization': `Bearer ${token}`
-                    }
+                const result = await finishSession(token, sessionKey, {
+                    duration: totalTime,
+                    mode: mode === 'buddy' ? 'buddy' : 'solo',
+                    completed: true,
+                    partnerLeft: partnerLeft && !partnerCompleted,
+                    partnerUsername,
                 });
-                const statsData = await statsResponse.json();
-                setUserStats(statsData);
+                reward = result.reward;
+                setCoins(result.stats.coins);
+                setUserStats(result.stats);
             }
 
             if (mode === 'buddy' && partnerId) {
@@ -242,8 +230,16 @@ export default function FocusScreen() {
                     onPress: async () => {
                         try {
                             if (token) {
-                                const updatedCoins = await updateUserCoins(token, reward.points);
-                                setCoins(updatedCoins);
+                                const result = await finishSession(token, sessionKey, {
+                                    duration: totalTime - timeLeft,
+                                    plannedDuration: totalTime,
+                                    mode: mode === 'buddy' ? 'buddy' : 'solo',
+                                    completed: false,
+                                    partnerLeft,
+                                    partnerUsername,
+                                });
+                                setCoins(result.stats.coins);
+                                setUserStats(result.stats);
                             }
                             setAlertConfig(prev => ({ ...prev, visible: false }));
                             router.replace('/home');
@@ -9,7 +9,7 @@ export const REWARD_POINTS = {
 export interface RewardResult {
     points: number;
     message: string;
-    type: 'success' | 'penalty' | 'partner_left';
+    type: 'success' | 'penalty' | 'partner_left' | 'quit';
 }
 
 export const calculateReward = (
@@ -71,6 +71,56 @@ export const updateUserCoins = async (token: string, amount: number): Promise<nu
     }
 };
 
+export interface FinishSessionResult {
+    reward: RewardResult;
+    applied: boolean;
+    stats: {
+        totalSessions: number;
+        totalFocusTime: number;
+        coins: number;
+    };
+}
+
+// Settles a session in one request: the server computes the reward and
+// updates coins and stats together. Retries with the same sessionKey are
+// only credited once.
+export const finishSession = async (
+    token: string,
+    sessionKey: string,
+    session: {
+        // Seconds actually focused; recorded in the session history.
+        duration: number;
+        // Planned length in seconds; rewards and penalties are based on it.
+        // Defaults to duration.
+        plannedDuration?: number;
+        mode: 'solo' | 'buddy';
+        completed: boolean;
+        partnerLeft: boolean;
+        partnerUsername?: string;
+    }
+): Promise<FinishSessionResult> => {
+    try {
+        const response = await fetch('http://localhost:5000/api/sessions/finish', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'Authorization': `Bearer ${token}`,
+                'Idempotency-Key': sessionKey,
+            },
+            body: JSON.stringify(session),
+        });
+
+        if (!response.ok) {
+            throw new Error('Failed to finish session');
+        }
+
+        return await response.json();
+    } catch (error) {
+        console.error('Error finishing session:', error);
+        throw error;
+    }
+};
+
 export const getUserCoins = async (token: string): Promise<number> => {
     try {
         const response = await fetch('http://localhost:5000/api/coins', {
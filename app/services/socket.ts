@@ -1,8 +1,13 @@
 import { io, Socket } from 'socket.io-client';
 
+const HEARTBEAT_INTERVAL = 10000;
+
 class SocketService {
     private socket: Socket | null = null;
     private static instance: SocketService;
+    private sessionId: string | null = null;
+    private resumeToken: string | null = null;
+    private heartbeatTimer: ReturnType<typeof setInterval> | null = null;
 
     private constructor() { }
 
@@ -20,11 +25,23 @@ class SocketService {
 
         this.socket.on('connect', () => {
             console.log('Connected to server');
+            // 断线重连后回到原来的配对会话
+            if (this.sessionId && this.resumeToken && this.socket) {
+                this.socket.emit('resume_session', {
+                    session_id: this.sessionId,
+                    resume_token: this.resumeToken
+                });
+            }
         });
 
         this.socket.on('disconnect', () => {
             console.log('Disconnected from server');
         });
+
+        this.socket.on('session_expired', () => {
+            console.log('Buddy session expired');
+            this.endSession();
+        });
     }
 
     startMatching(focusTime: number, username: string, callbacks: {
@@ -39,15 +56,25 @@ class SocketService {
         }
 
         this.removeAllListeners();
+        this.endSession();
 
         this.socket.on('match_success', (data: {
             partner_id: string;
             partner_username: string;
+            session_id: string | null;
+            resume_token: string | null;
         }) => {
             console.log('Match success:', data);
+            if (data.session_id) {
+                this.startSession(data.session_id, data.resume_token);
+            }
             callbacks.onMatch(data.partner_id, data.partner_username);
         });
 
+        this.socket.on('partner_resumed', (data: { partner_id: string }) => {
+            console.log('Partner reconnected:', data);
+        });
+
         this.socket.on('match_timeout', () => {
             console.log('Match timeout received, triggering callback');
             setTimeout(() => {
@@ -55,8 +82,31 @@ class SocketService {
             }, 0);
         });
 
+        this.watchSession(callbacks);
+
+        console.log('Emitting start_matching with focus time:', focusTime);
+        this.socket.emit('start_matching', {
+            focus_time: focusTime,
+            username: username
+        });
+    }
+
+    // 只监听当前会话的伙伴事件；再次 start_matching 会让服务端结束当前会话
+    watchSession(callbacks: {
+        onPartnerLeave?: () => void;
+        onPartnerComplete?: () => void;
+    }) {
+        if (!this.socket) {
+            console.log('Socket not connected');
+            return;
+        }
+
+        this.socket.off('partner_left');
+        this.socket.off('partner_complete');
+
         this.socket.on('partner_left', () => {
             console.log('Partner left');
+            this.endSession();
             if (callbacks.onPartnerLeave) {
                 callbacks.onPartnerLeave();
             }
@@ -68,22 +118,39 @@ class SocketService {
                 callbacks.onPartnerComplete();
             }
         });
-
-        console.log('Emitting start_matching with focus time:', focusTime);
-        this.socket.emit('start_matching', {
-            focus_time: focusTime,
-            username: username
-        });
     }
 
     notifyLeaving(partnerId: string) {
         if (!this.socket) return;
         this.socket.emit('leaving_session', { partner_id: partnerId });
+        this.endSession();
     }
 
     notifyCompletion(partnerId: string) {
         if (!this.socket) return;
         this.socket.emit('session_complete', { partner_id: partnerId });
+        this.endSession();
+    }
+
+    private startSession(sessionId: string, resumeToken: string | null) {
+        this.endSession();
+        this.sessionId = sessionId;
+        this.resumeToken = resumeToken;
+        // 服务端超过 HEARTBEAT_TIMEOUT 收不到心跳就会通知伙伴 partner_left
+        this.heartbeatTimer = setInterval(() => {
+            if (this.socket?.connected) {
+                this.socket.emit('heartbeat');
+            }
+        }, HEARTBEAT_INTERVAL);
+    }
+
+    private endSession() {
+        if (this.heartbeatTimer) {
+            clearInterval(this.heartbeatTimer);
+            this.heartbeatTimer = null;
+        }
+        this.sessionId = null;
+        this.resumeToken = null;
     }
 
     private removeAllListeners() {
@@ -91,10 +158,13 @@ class SocketService {
         this.socket.off('match_success');
         this.socket.off('match_timeout');
         this.socket.off('partner_left');
+        this.socket.off('partner_complete');
+        this.socket.off('partner_resumed');
     }
 
     disconnect() {
         if (this.socket) {
+            this.endSession();
             this.removeAllListeners();
             this.socket.disconnect();
             this.socket = null;
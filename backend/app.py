@@ -1,8 +1,19 @@
-from flask import Flask, request, jsonify
+import os
+
+# eventlet 模式（未指定 SOCKETIO_ASYNC_MODE 时默认选择）下只有一个 OS 线程：连接池的等待、
+# redis 客户端的网络 IO 等都必须与 eventlet 协作，否则一次阻塞就会卡住所有 green thread
+if os.environ.get("SOCKETIO_ASYNC_MODE", "eventlet") == "eventlet":
+    try:
+        import eventlet
+    except ImportError:
+        pass
+    else:
+        eventlet.monkey_patch()
+
+from flask import Flask, request, jsonify, g, Response
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
 from flask_socketio import SocketIO, emit
-from werkzeug.security import generate_password_hash, check_password_hash
 from flask_jwt_extended import (
     JWTManager,
     jwt_required,
@@ -10,9 +21,30 @@ from flask_jwt_extended import (
     create_access_token,
 )
 import datetime
-from collections import defaultdict
+import functools
+import math
 import time
 
+import logs
+from cache import RedisInvalidations, StatsCache
+from leaderboard import Leaderboard
+from ledger import LedgerBatcher, LedgerEntry, FocusRecord, ROLLUP_GRANULARITIES
+from matchmaking import Matchmaker, RedisMatchmaker
+from metrics import Registry
+from migrations import migrate
+from passwords import PasswordHasher
+from presence import Presence, RedisPresence
+from rewards import calculate_reward
+from sessions import BuddyRegistry, RedisBuddyRegistry
+from storage import database_url, enable_sqlite_pragmas, engine_options
+
+# 结构化日志：LOG_LEVEL 控制级别，热路径的 debug 日志按 LOG_DEBUG_SAMPLE_RATE 采样
+logs.configure(
+    level=os.environ.get("LOG_LEVEL", "INFO"),
+    debug_sample_rate=float(os.environ.get("LOG_DEBUG_SAMPLE_RATE", 0.01)),
+)
+log = logs.get_logger("app")
+
 app = Flask(__name__)
 CORS(
     app,
@@ -27,8 +59,42 @@ CORS(
 
 # 配置
 app.config["SECRET_KEY"] = "your-secret-key"  # 用于JWT签名
-app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///users.db"
+app.config["SQLALCHEMY_DATABASE_URI"] = database_url(
+    os.environ.get("DATABASE_URL", "sqlite:///users.db")
+)
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+# 数据库调优：SQLite 使用 WAL、busy timeout 等设置，连接池大小按每个 worker 的并发量配置。
+# DB_TUNING=0 时退回 SQLAlchemy 默认设置（仅用于对比测试）
+app.config["DB_TUNING"] = os.environ.get("DB_TUNING", "1") == "1"
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(
+    app.config["SQLALCHEMY_DATABASE_URI"],
+    pool_size=int(os.environ.get("DB_POOL_SIZE", 10)),
+    max_overflow=int(os.environ.get("DB_MAX_OVERFLOW", 20)),
+    tuned=app.config["DB_TUNING"],
+)
+if app.config["DB_TUNING"]:
+    enable_sqlite_pragmas(
+        busy_timeout_ms=int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", 5000)),
+        mmap_size=int(os.environ.get("SQLITE_MMAP_SIZE", 256 * 1024 * 1024)),
+    )
+
+# 设置后多个 worker 通过 Redis 共享 Socket.IO 消息、匹配队列和在线状态
+app.config["REDIS_URL"] = os.environ.get("REDIS_URL")
+
+# 用户统计缓存：多 worker 时其他 worker 的缓存最多滞后 TTL 秒
+app.config["STATS_CACHE_SIZE"] = int(os.environ.get("STATS_CACHE_SIZE", 10000))
+app.config["STATS_CACHE_TTL"] = float(os.environ.get("STATS_CACHE_TTL", 30))
+
+# 排行榜：内存中保留前 N 名，定期从数据库同步其他 worker 的写入
+app.config["LEADERBOARD_SIZE"] = int(os.environ.get("LEADERBOARD_SIZE", 100))
+app.config["LEADERBOARD_REFRESH"] = float(os.environ.get("LEADERBOARD_REFRESH", 60))
+
+# 密码哈希配置，修改后用户下次登录时会自动按新参数重新哈希
+app.config["PASSWORD_HASH_METHOD"] = os.environ.get(
+    "PASSWORD_HASH_METHOD", "pbkdf2:sha256:260000"
+)
+app.config["PASSWORD_SALT_LENGTH"] = int(os.environ.get("PASSWORD_SALT_LENGTH", 16))
+app.config["PASSWORD_HASH_WORKERS"] = int(os.environ.get("PASSWORD_HASH_WORKERS", 4))
 
 # JWT配置
 app.config["JWT_SECRET_KEY"] = "your-secret-key"  # 修改为你的密钥
@@ -36,24 +102,160 @@ jwt = JWTManager(app)  # 初始化 JWT
 
 db = SQLAlchemy(app)
 socketio = SocketIO(
-    app, cors_allowed_origins=["http://localhost:8081", "http://localhost:19006"]
+    app,
+    cors_allowed_origins=["http://localhost:8081", "http://localhost:19006"],
+    message_queue=app.config["REDIS_URL"],
+    async_mode=os.environ.get("SOCKETIO_ASYNC_MODE"),  # 默认自动选择（eventlet）
+)
+
+passwords = PasswordHasher(
+    app.config["PASSWORD_HASH_METHOD"],
+    salt_length=app.config["PASSWORD_SALT_LENGTH"],
+    max_workers=app.config["PASSWORD_HASH_WORKERS"],
+    async_mode=socketio.async_mode,
+)
+
+# 存储等待配对的用户和已连接的用户
+MATCH_TIMEOUT = float(os.environ.get("MATCH_TIMEOUT", 30))  # 秒
+MATCH_TIMER_TICK = 1.0  # 超时检查的最长间隔（秒）
+HEARTBEAT_TIMEOUT = float(os.environ.get("HEARTBEAT_TIMEOUT", 30))  # 秒
+RESUME_GRACE_PERIOD = float(os.environ.get("RESUME_GRACE_PERIOD", 30))  # 秒
+PRESENCE_HEARTBEAT_INTERVAL = 10  # 秒，worker 超过 3 个间隔没有心跳即视为已崩溃
+
+if app.config["REDIS_URL"]:
+    import redis
+
+    redis_client = redis.Redis.from_url(app.config["REDIS_URL"], decode_responses=True)
+    matchmaker = RedisMatchmaker(redis_client, timeout=MATCH_TIMEOUT)
+    connected_users = RedisPresence(
+        redis_client, worker_timeout=3 * PRESENCE_HEARTBEAT_INTERVAL
+    )
+    # 配对双方可能连接在不同 worker 上，会话登记也放在 Redis 中
+    buddies = RedisBuddyRegistry(
+        redis_client,
+        heartbeat_timeout=HEARTBEAT_TIMEOUT,
+        grace_period=RESUME_GRACE_PERIOD,
+    )
+else:
+    matchmaker = Matchmaker(timeout=MATCH_TIMEOUT)
+    connected_users = Presence()
+    buddies = BuddyRegistry(
+        heartbeat_timeout=HEARTBEAT_TIMEOUT, grace_period=RESUME_GRACE_PERIOD
+    )
+
+# 指标，通过 /metrics 以 Prometheus 文本格式暴露
+metrics = Registry()
+http_latency = metrics.histogram(
+    "focuser_http_request_duration_seconds",
+    "HTTP request latency",
+    ["method", "route", "status"],
+)
+event_latency = metrics.histogram(
+    "focuser_socketio_event_duration_seconds",
+    "Socket.IO event handler latency",
+    ["event"],
+)
+match_requests = metrics.counter(
+    "focuser_match_requests_total", "start_matching events received"
 )
+matches = metrics.counter("focuser_matches_total", "Successful buddy matches")
+match_timeouts = metrics.counter(
+    "focuser_match_timeouts_total", "Users whose matching timed out"
+)
+db_commit_latency = metrics.histogram(
+    "focuser_db_commit_duration_seconds", "Database commit latency", ["source"]
+)
+ledger_batch_size = metrics.histogram(
+    "focuser_ledger_batch_size",
+    "Entries committed per ledger transaction",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500),
+)
+event_loop_lag = metrics.histogram(
+    "focuser_event_loop_lag_seconds", "Delay of a periodic sleep beyond its deadline"
+)
+# 设置 REDIS_URL 时等待队列和会话登记由所有 worker 共享，每个 worker 报告的是同一个
+# 全局值，用 scope="cluster" 标明，聚合时取 max 而不是 sum
+METRIC_SCOPE = "cluster" if app.config["REDIS_URL"] else "worker"
+metrics.gauge(
+    "focuser_waiting_users",
+    "Users waiting for a buddy, per focus_time; scope=\"cluster\" values are shared by all workers (aggregate with max, not sum)",
+    ["focus_time", "scope"],
+    callback=lambda: {
+        (focus_time, METRIC_SCOPE): depth
+        for focus_time, depth in matchmaker.depths().items()
+    },
+)
+metrics.gauge(
+    "focuser_connected_sockets",
+    "Socket.IO clients connected to this worker",
+    callback=lambda: {(): connected_users.local_count()},
+)
+metrics.gauge(
+    "focuser_buddy_sessions",
+    "Active buddy sessions; scope=\"cluster\" values are shared by all workers (aggregate with max, not sum)",
+    ["scope"],
+    callback=lambda: {(METRIC_SCOPE,): len(buddies)},
+)
+buddy_expirations = metrics.counter(
+    "focuser_buddy_expirations_total",
+    "partner_left notifications sent after missed heartbeats or an expired reconnect window",
+)
+EVENT_LOOP_LAG_INTERVAL = 0.5  # 秒
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def record_request_latency(response):
+    started = getattr(g, "request_started", None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        http_latency.observe(
+            time.perf_counter() - started, request.method, route, response.status_code
+        )
+    return response
+
 
-# 在 socketio = SocketIO(...) 之后添加
-connected_users = {}
+def on_event(event):
+    # 代替 @socketio.on，额外记录处理耗时
+    def decorator(handler):
+        @functools.wraps(handler)
+        def timed_handler(*args):
+            with event_latency.time(event):
+                return handler(*args)
 
+        return socketio.on(event)(timed_handler)
 
-@socketio.on("connect")
-def handle_connect():
-    print("Client connected")
-    connected_users[request.sid] = request.sid  # 存储连接的用户
+    return decorator
 
 
-@socketio.on("disconnect")
+def run_event_loop_lag_monitor():
+    # 定期休眠并测量实际醒来的延迟，反映 hub 被阻塞的程度
+    while True:
+        started = time.perf_counter()
+        socketio.sleep(EVENT_LOOP_LAG_INTERVAL)
+        event_loop_lag.observe(
+            max(time.perf_counter() - started - EVENT_LOOP_LAG_INTERVAL, 0)
+        )
+
+
+@on_event("connect")
+def handle_connect(auth=None):
+    ensure_background_tasks()
+    log.debug("client_connected", sid=request.sid)
+    connected_users.add(request.sid)  # 存储连接的用户
+
+
+@on_event("disconnect")
 def handle_disconnect():
-    print("Client disconnected")
-    if request.sid in connected_users:
-        del connected_users[request.sid]
+    log.debug("client_disconnected", sid=request.sid)
+    connected_users.discard(request.sid)
+    # 断开连接的用户不再参与匹配；进行中的会话保留一段时间等待重连
+    matchmaker.cancel(request.sid)
+    buddies.disconnect(request.sid)
 
 
 # 用户模型
@@ -61,18 +263,128 @@ class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
     password = db.Column(db.String(120), nullable=False)
-    coins = db.Column(db.Integer, default=0)
-    total_sessions = db.Column(db.Integer, default=0)
-    total_focus_time = db.Column(db.Integer, default=0)
+    coins = db.Column(db.Integer, default=0, server_default="0")
+    total_sessions = db.Column(db.Integer, default=0, server_default="0")
+    total_focus_time = db.Column(
+        db.Integer, default=0, server_default="0", index=True
+    )
 
-    def update_coins(self, amount):
-        self.coins += amount
-        db.session.commit()
+
+# 金币账本：只追加，不修改；余额变化和统计由 LedgerBatcher 批量提交
+class CoinLedger(db.Model):
+    __table_args__ = (
+        db.UniqueConstraint("user_id", "idempotency_key"),
+        db.Index("ix_coin_ledger_user_id_created_at", "user_id", "created_at"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    amount = db.Column(db.Integer, nullable=False)
+    reason = db.Column(db.String(32), nullable=False)
+    idempotency_key = db.Column(db.String(64))
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+
+
+# 专注记录：每次结算一条
+class FocusSession(db.Model):
+    __table_args__ = (
+        db.Index("ix_focus_session_user_id_started_at", "user_id", "started_at"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    started_at = db.Column(db.DateTime, nullable=False)
+    duration = db.Column(db.Integer, nullable=False)  # 秒
+    mode = db.Column(db.String(10), nullable=False)  # solo / buddy
+    outcome = db.Column(db.String(16), nullable=False)  # success / partner_left / quit
+    partner_username = db.Column(db.String(80))
+
+
+# 按小时/天增量维护的专注汇总，历史查询直接读取
+class FocusRollup(db.Model):
+    __table_args__ = (db.UniqueConstraint("user_id", "granularity", "bucket_start"),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    granularity = db.Column(db.String(8), nullable=False)  # hour / day
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    sessions = db.Column(db.Integer, nullable=False, default=0)
+    completed_sessions = db.Column(db.Integer, nullable=False, default=0)
+    buddy_sessions = db.Column(db.Integer, nullable=False, default=0)
+    focus_time = db.Column(db.Integer, nullable=False, default=0)  # 分钟
 
 
 # 创建数据库表
 with app.app_context():
     db.create_all()  # 创建新表
+    migrate(db)  # 升级已有的表
+
+stats_cache = StatsCache(
+    maxsize=app.config["STATS_CACHE_SIZE"], ttl=app.config["STATS_CACHE_TTL"]
+)
+metrics.counter(
+    "focuser_stats_cache_lookups_total",
+    "Stats cache lookups by result (hit rate = rate(hit) / rate(hit + miss))",
+    ["result"],
+    callback=lambda: {"hit": stats_cache.hits, "miss": stats_cache.misses},
+)
+if app.config["REDIS_URL"]:
+    # 其他 worker 的写入通过 pub/sub 使本地缓存失效
+    stats_invalidations = RedisInvalidations(redis_client, stats_cache)
+    socketio.start_background_task(stats_invalidations.listen)
+    invalidate_stats = stats_invalidations.publish
+else:
+    invalidate_stats = stats_cache.invalidate
+leaderboard = Leaderboard(
+    size=app.config["LEADERBOARD_SIZE"],
+    refresh_interval=app.config["LEADERBOARD_REFRESH"],
+)
+
+
+def handle_ledger_commit(changed):
+    invalidate_stats(changed)
+    for user_id, stats in changed.items():
+        leaderboard.update(user_id, stats["username"], stats["totalFocusTime"])
+
+
+ledger = LedgerBatcher(
+    app,
+    db,
+    User,
+    CoinLedger,
+    socketio,
+    session_model=FocusSession,
+    rollup_model=FocusRollup,
+    on_commit=handle_ledger_commit,
+    commit_histogram=db_commit_latency,
+    batch_histogram=ledger_batch_size,
+)
+
+
+def load_user_stats(user_id):
+    def load():
+        user = User.query.get(user_id)
+        if not user:
+            return None
+        return {
+            "totalSessions": user.total_sessions,
+            "totalFocusTime": user.total_focus_time,
+            "coins": user.coins,
+        }
+
+    return stats_cache.get_or_load(user_id, load)
+
+
+def conditional_response(payload, etag):
+    # 客户端 If-None-Match 与当前 ETag 一致时返回 304，不带响应体
+    response = jsonify(payload)
+    response.set_etag(etag)
+    return response.make_conditional(request)
+
+
+def get_idempotency_key(data):
+    # 客户端重试时携带相同的 key，避免重复记账
+    return request.headers.get("Idempotency-Key") or data.get("idempotency_key")
 
 
 @app.route("/api/register", methods=["POST"])
@@ -85,13 +397,16 @@ def register():
         if not username or not password:
             return jsonify({"message": "Username and password are required"}), 400
 
+        # 先哈希再查询：哈希耗时较长，期间不应占用连接池中的连接
+        hashed_password = passwords.hash(password)
+
         if User.query.filter_by(username=username).first():
             return jsonify({"message": "Username already exists"}), 400
 
-        hashed_password = generate_password_hash(password)
         new_user = User(username=username, password=hashed_password)
         db.session.add(new_user)
-        db.session.commit()
+        with db_commit_latency.time("register"):
+            db.session.commit()
 
         access_token = create_access_token(
             identity=new_user.id, expires_delta=datetime.timedelta(days=1)
@@ -104,7 +419,7 @@ def register():
             }
         ), 201
     except Exception as e:
-        print(f"Registration error: {str(e)}")  # 添加错误日志
+        log.exception("registration_failed", error=str(e))
         return jsonify({"message": "Server error"}), 500
 
 
@@ -119,86 +434,204 @@ def login():
             return jsonify({"message": "Username and password are required"}), 400
 
         user = User.query.filter_by(username=username).first()
+        if not user:
+            return jsonify({"message": "Invalid username or password"}), 401
 
-        if not user or not check_password_hash(user.password, password):
+        # 校验哈希耗时较长，先结束事务把连接还给连接池
+        user_id, stored_hash = user.id, user.password
+        db.session.rollback()
+
+        if not passwords.verify(stored_hash, password):
             return jsonify({"message": "Invalid username or password"}), 401
 
+        # 哈希参数变化后，用户登录时透明地升级存储的哈希；期间密码若已被修改则不覆盖
+        if passwords.needs_rehash(stored_hash):
+            new_hash = passwords.hash(password)
+            User.query.filter_by(id=user_id, password=stored_hash).update(
+                {"password": new_hash}
+            )
+            with db_commit_latency.time("rehash"):
+                db.session.commit()
+
         access_token = create_access_token(
-            identity=user.id, expires_delta=datetime.timedelta(days=1)
+            identity=user_id, expires_delta=datetime.timedelta(days=1)
         )
 
         return jsonify(
-            {"token": access_token, "user": {"id": user.id, "username": user.username}}
+            {"token": access_token, "user": {"id": user_id, "username": username}}
         )
     except Exception as e:
-        print(f"Login error: {str(e)}")  # 添加错误日志
+        log.exception("login_failed", error=str(e))
         return jsonify({"message": "Server error"}), 500
 
 
-# 存储等待配对的用户
-waiting_users = defaultdict(
-    list
-)  # key: focus_time, value: list of (user_id, username) tuples
-
-
-@socketio.on("start_matching")
+background_tasks_started = False
+
+
+def run_match_timer():
+    # 所有等待者共用一个后台任务，按最近的截止时间休眠后统一发送超时。
+    # 多 worker 时每个 worker 都运行该任务，Redis 脚本保证每个超时只被取出一次，
+    # 通知经消息队列送达持有该连接的 worker。
+    while True:
+        for sid in matchmaker.expire():
+            match_timeouts.inc()
+            log.debug("match_timeout", sid=sid)
+            socketio.emit("match_timeout", room=sid)
+
+        deadline = matchmaker.next_deadline()
+        delay = MATCH_TIMER_TICK
+        if deadline is not None:
+            delay = min(max(deadline - matchmaker.clock(), 0), MATCH_TIMER_TICK)
+        socketio.sleep(delay)
+
+
+def run_buddy_monitor():
+    # 与匹配超时相同的做法：一个后台任务检查所有会话的心跳和重连期限。
+    # Redis 模式下每个 worker 都运行，expire() 是原子的，同一个超时只通知一次
+    while True:
+        for partner_id in buddies.expire():
+            buddy_expirations.inc()
+            log.debug("partner_left_sent", partner_id=partner_id, reason="expired")
+            socketio.emit("partner_left", room=partner_id)
+
+        deadline = buddies.next_deadline()
+        delay = MATCH_TIMER_TICK
+        if deadline is not None:
+            delay = min(max(deadline - buddies.clock(), 0), MATCH_TIMER_TICK)
+        socketio.sleep(delay)
+
+
+def run_presence_heartbeat():
+    # Redis 模式下刷新本 worker 的在线心跳，并清理已崩溃的 worker 留下的 sid
+    while True:
+        try:
+            reaped = connected_users.refresh()
+            if reaped:
+                log.warning("presence_workers_reaped", count=reaped)
+        except Exception as e:
+            log.warning("presence_heartbeat_failed", error=str(e))
+        socketio.sleep(PRESENCE_HEARTBEAT_INTERVAL)
+
+
+def ensure_background_tasks():
+    global background_tasks_started
+    if not background_tasks_started:
+        background_tasks_started = True
+        socketio.start_background_task(run_match_timer)
+        socketio.start_background_task(run_event_loop_lag_monitor)
+        socketio.start_background_task(run_buddy_monitor)
+        if isinstance(connected_users, RedisPresence):
+            socketio.start_background_task(run_presence_heartbeat)
+
+
+@on_event("start_matching")
 def handle_matching(data):
+    ensure_background_tasks()
+    match_requests.inc()
+
     user_id = request.sid
     focus_time = data.get("focus_time")
     username = data.get("username")
 
-    # 将用户添加到等待列表
-    waiting_users[focus_time].append((user_id, username))
-
-    # 检查是否有其他用户在等待相同时长
-    if len(waiting_users[focus_time]) >= 2:
-        # 获取第一个等待的用户
-        partner_id, partner_username = waiting_users[focus_time][0]
-        if partner_id != user_id:
-            # 匹配成功，通知双方
-            emit(
-                "match_success",
-                {"partner_id": user_id, "partner_username": username},
-                room=partner_id,
-            )
-            emit(
-                "match_success",
-                {"partner_id": partner_id, "partner_username": partner_username},
-                room=user_id,
-            )
-            # 从等待列表中移除这两个用户
-            waiting_users[focus_time].remove((partner_id, partner_username))
-            waiting_users[focus_time].remove((user_id, username))
-            return
+    # focus_time 会作为队列的键（Redis 模式下还是脚本参数），只接受非负的有限数值
+    if (
+        not isinstance(focus_time, (int, float))
+        or isinstance(focus_time, bool)
+        or not math.isfinite(focus_time)
+        or focus_time < 0
+    ):
+        log.warning("invalid_focus_time", sid=user_id, focus_time=repr(focus_time))
+        return
+
+    # 重新匹配意味着离开之前的会话
+    previous_partner_id = buddies.leave(user_id)
+    if previous_partner_id:
+        emit("partner_left", room=previous_partner_id)
+
+    # 有相同时长的用户在等待则直接配对，否则加入等待队列
+    match = matchmaker.enqueue(user_id, focus_time, username)
+    if match:
+        partner_id, partner_username = match
+        matches.inc()
+        session_id, resume_token, partner_resume_token = buddies.pair(
+            user_id, username, partner_id, partner_username
+        )
+        log.debug("match_success", sid=user_id, partner_id=partner_id)
+        # 匹配成功，通知双方；resume token 只发给各自本人
+        emit(
+            "match_success",
+            {
+                "partner_id": user_id,
+                "partner_username": username,
+                "session_id": session_id,
+                "resume_token": partner_resume_token,
+            },
+            room=partner_id,
+        )
+        emit(
+            "match_success",
+            {
+                "partner_id": partner_id,
+                "partner_username": partner_username,
+                "session_id": session_id,
+                "resume_token": resume_token,
+            },
+            room=user_id,
+        )
+
+
+@on_event("heartbeat")
+def handle_heartbeat(data=None):
+    # 返回值作为 ack：False 表示服务端已没有该连接的会话
+    return buddies.heartbeat(request.sid)
+
 
-    # 设置30秒超时
-    socketio.sleep(30)
+@on_event("resume_session")
+def handle_resume(data):
+    # 断线重连后凭 session_id 和配对时拿到的 resume token 回到原会话，伙伴收到新的 partner_id
+    result = buddies.resume(
+        request.sid, data.get("session_id"), data.get("resume_token")
+    )
+    if result is None:
+        emit("session_expired")
+        return
 
-    # 检查用户是否还在等待列表中
-    if user_id in waiting_users[focus_time]:
-        waiting_users[focus_time].remove(user_id)
-        emit("match_timeout", room=user_id)
+    username, partner_id, partner_username = result
+    emit(
+        "session_resumed",
+        {
+            "session_id": data.get("session_id"),
+            "partner_id": partner_id,
+            "partner_username": partner_username,
+        },
+    )
+    if partner_id:
+        emit(
+            "partner_resumed",
+            {"partner_id": request.sid, "partner_username": username},
+            room=partner_id,
+        )
 
 
-@socketio.on("leaving_session")
-def handle_leaving(data):
-    partner_id = data.get("partner_id")
+@on_event("leaving_session")
+def handle_leaving(data=None):
+    # 伙伴以服务端登记为准，忽略客户端提供的 partner_id
+    partner_id = buddies.leave(request.sid)
     if partner_id:
         # 通知伙伴该用户已离开
-        print(f"partner_left event emitted to partner_id: {partner_id}")
+        log.debug("partner_left_sent", sid=request.sid, partner_id=partner_id)
         emit("partner_left", room=partner_id)
 
 
-@socketio.on("session_complete")
-def handle_completion(data):
-    partner_id = data.get("partner_id")
-    print(f"session_complete received for partner_id: {partner_id}")
-    print(f"Current connected users: {connected_users}")  # 添加日志
+@on_event("session_complete")
+def handle_completion(data=None):
+    partner_id = buddies.complete(request.sid)
     if partner_id:
-        time.sleep(0.1)
-        print(f"Attempting to emit partner_complete to room: {partner_id}")
+        log.debug("partner_complete_sent", sid=request.sid, partner_id=partner_id)
         emit("partner_complete", room=partner_id)
-        print(f"partner_complete event emitted to partner_id: {partner_id}")
+
+
+MAX_COINS_DELTA = 1000000  # 单次金币变化的绝对值上限
 
 
 @app.route("/api/coins/update", methods=["POST"])
@@ -208,52 +641,72 @@ def update_coins():
     amount = data.get("amount")
     user_id = get_jwt_identity()
 
-    user = User.query.get(user_id)
-    if not user:
+    # bool 是 int 的子类；过大的值会在写入数据库时溢出
+    if (
+        not isinstance(amount, int)
+        or isinstance(amount, bool)
+        or abs(amount) > MAX_COINS_DELTA
+    ):
+        return jsonify({"message": "Amount must be an integer within ±1000000"}), 400
+
+    result = ledger.submit(
+        LedgerEntry(user_id, amount, "coins_update", get_idempotency_key(data))
+    )
+    if not result:
         return jsonify({"message": "User not found"}), 404
 
-    user.update_coins(amount)
-    return jsonify({"message": "Coins updated successfully", "coins": user.coins})
+    return jsonify({"message": "Coins updated successfully", "coins": result["coins"]})
 
 
 @app.route("/api/coins", methods=["GET"])
 @jwt_required()
 def get_coins():
     user_id = get_jwt_identity()
-    user = User.query.get(user_id)
-    if not user:
+    snapshot = load_user_stats(user_id)
+    if not snapshot:
         return jsonify({"message": "User not found"}), 404
 
-    return jsonify({"coins": user.coins})
+    return conditional_response({"coins": snapshot.stats["coins"]}, snapshot.etag)
 
 
-@socketio.on("notify_leaving")
-def handle_notify_leaving(partner_id):
-    print(f"notify_leaving event received. partner_id: {partner_id}")
+@on_event("notify_leaving")
+def handle_notify_leaving(data=None):
+    # 与 leaving_session 相同；客户端传来的 partner_id 不再使用
+    partner_id = buddies.leave(request.sid)
     # 确保 partner_id 存在且有效
     if partner_id and partner_id in connected_users:
-        print(f"Emitting partner_left event to partner_id: {partner_id}")
-        emit("partner_left", room=connected_users[partner_id])
+        log.debug("partner_left_sent", sid=request.sid, partner_id=partner_id)
+        emit("partner_left", room=partner_id)
     else:
-        print(
-            f"Failed to emit partner_left. partner_id {partner_id} not found in connected_users"
-        )
+        log.warning("partner_not_connected", sid=request.sid, partner_id=partner_id)
 
 
 @app.route("/api/user/stats", methods=["GET"])
 @jwt_required()
 def get_user_stats():
     user_id = get_jwt_identity()
-    user = User.query.get(user_id)
-    if not user:
+    snapshot = load_user_stats(user_id)
+    if not snapshot:
         return jsonify({"message": "User not found"}), 404
 
-    return jsonify(
-        {
-            "totalSessions": user.total_sessions,
-            "totalFocusTime": user.total_focus_time,
-            "coins": user.coins,
-        }
+    return conditional_response(snapshot.stats, snapshot.etag)
+
+
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+MAX_SESSION_DURATION = 24 * 60 * 60  # 秒
+
+
+def is_session_duration(value):
+    # 只接受 0 到 24 小时之间的有限数值（秒），排除 JSON 布尔值
+    return (
+        isinstance(value, (int, float))
+        and not isinstance(value, bool)
+        and math.isfinite(value)
+        and 0 <= value <= MAX_SESSION_DURATION
     )
 
 
@@ -261,16 +714,221 @@ def get_user_stats():
 @jwt_required()
 def complete_focus():
     user_id = get_jwt_identity()
-    user = User.query.get(user_id)
     data = request.get_json()
     focus_time = data.get("focusTime")
-    if user:
-        user.total_sessions += 1
-        user.total_focus_time += focus_time
-        db.session.commit()
 
+    if (
+        not isinstance(focus_time, (int, float))
+        or isinstance(focus_time, bool)
+        or not math.isfinite(focus_time)
+        or focus_time < 0
+        or focus_time > MAX_SESSION_DURATION / 60
+    ):
+        return jsonify({"message": "focusTime must be between 0 and 1440 minutes"}), 400
+
+    mode = data.get("mode", "solo")
+    if mode not in ("solo", "buddy"):
+        return jsonify({"message": "mode must be 'solo' or 'buddy'"}), 400
+
+    duration = round(focus_time * 60)
+    ledger.submit(
+        LedgerEntry(
+            user_id,
+            0,
+            "focus_complete",
+            get_idempotency_key(data),
+            sessions=1,
+            focus_time=focus_time,
+            session=FocusRecord(
+                started_at=datetime.datetime.utcnow()
+                - datetime.timedelta(seconds=duration),
+                duration=duration,
+                mode=mode,
+                outcome="success",
+                focus_time=focus_time,
+            ),
+        )
+    )
     return jsonify({"success": True})
 
 
+@app.route("/api/sessions/finish", methods=["POST"])
+@jwt_required()
+def finish_session():
+    # 一次请求完成结算：服务端计算奖励，金币和统计在同一个事务中更新
+    user_id = get_jwt_identity()
+    data = request.get_json()
+    duration = data.get("duration")  # 秒，实际专注的时长
+    # 计划时长（秒），奖励和放弃的扣分按它计算；未提供时与 duration 相同
+    planned_duration = data.get("plannedDuration", duration)
+    mode = data.get("mode", "solo")
+    completed = data.get("completed")
+    partner_left = data.get("partnerLeft", False)
+
+    if not is_session_duration(duration) or not is_session_duration(planned_duration):
+        return jsonify(
+            {"message": "duration and plannedDuration must be between 0 and 24 hours"}
+        ), 400
+    if mode not in ("solo", "buddy"):
+        return jsonify({"message": "mode must be 'solo' or 'buddy'"}), 400
+    # 只接受 JSON 布尔值，避免 "false" 这样的字符串被当成完成
+    if not isinstance(completed, bool) or not isinstance(partner_left, bool):
+        return jsonify({"message": "completed and partnerLeft must be booleans"}), 400
+
+    reward = calculate_reward(planned_duration, mode == "buddy", completed, partner_left)
+    focus_minutes = duration / 60  # 与 /api/focus/complete 一致，统计按分钟累计
+    if focus_minutes.is_integer():
+        focus_minutes = int(focus_minutes)
+    result = ledger.submit(
+        LedgerEntry(
+            user_id,
+            reward["points"],
+            f"session_{reward['type']}",
+            get_idempotency_key(data),
+            sessions=1 if completed else 0,
+            focus_time=focus_minutes if completed else 0,
+            session=FocusRecord(
+                started_at=datetime.datetime.utcnow()
+                - datetime.timedelta(seconds=duration),
+                duration=round(duration),
+                mode=mode,
+                outcome=reward["type"],
+                focus_time=focus_minutes if completed else 0,
+                partner_username=data.get("partnerUsername"),
+            ),
+        )
+    )
+    if not result:
+        return jsonify({"message": "User not found"}), 404
+
+    return jsonify(
+        {
+            "reward": reward,
+            "applied": result["applied"],
+            "stats": {
+                "totalSessions": result["totalSessions"],
+                "totalFocusTime": result["totalFocusTime"],
+                "coins": result["coins"],
+            },
+        }
+    )
+
+
+HISTORY_PAGE_SIZE = 30
+HISTORY_MAX_PAGE_SIZE = 100
+
+
+@app.route("/api/user/history", methods=["GET"])
+@jwt_required()
+def get_user_history():
+    # 按时间倒序分页，before 为上一页返回的 nextCursor
+    user_id = get_jwt_identity()
+    granularity = request.args.get("granularity", "day")
+    limit = min(
+        request.args.get("limit", HISTORY_PAGE_SIZE, type=int), HISTORY_MAX_PAGE_SIZE
+    )
+    before = request.args.get("before")
+
+    if granularity not in ROLLUP_GRANULARITIES + ("session",):
+        return jsonify({"message": "granularity must be hour, day or session"}), 400
+    if limit < 1:
+        return jsonify({"message": "limit must be positive"}), 400
+
+    try:
+        if granularity == "session":
+            items, next_cursor = session_history(user_id, limit, before)
+        else:
+            items, next_cursor = rollup_history(user_id, granularity, limit, before)
+    except ValueError:
+        return jsonify({"message": "Invalid cursor"}), 400
+
+    return jsonify(
+        {"granularity": granularity, "items": items, "nextCursor": next_cursor}
+    )
+
+
+def rollup_history(user_id, granularity, limit, before):
+    query = FocusRollup.query.filter_by(user_id=user_id, granularity=granularity)
+    if before:
+        query = query.filter(
+            FocusRollup.bucket_start < datetime.datetime.fromisoformat(before)
+        )
+    rows = query.order_by(FocusRollup.bucket_start.desc()).limit(limit).all()
+
+    items = [
+        {
+            "start": row.bucket_start.isoformat(),
+            "sessions": row.sessions,
+            "completedSessions": row.completed_sessions,
+            "buddySessions": row.buddy_sessions,
+            "focusTime": row.focus_time,
+        }
+        for row in rows
+    ]
+    next_cursor = rows[-1].bucket_start.isoformat() if len(rows) == limit else None
+    return items, next_cursor
+
+
+def session_history(user_id, limit, before):
+    query = FocusSession.query.filter_by(user_id=user_id)
+    if before:
+        # 游标为 "<started_at>_<id>"，保证同一时刻的多条记录也能稳定翻页
+        started_at, _, session_id = before.rpartition("_")
+        started_at = datetime.datetime.fromisoformat(started_at)
+        query = query.filter(
+            db.or_(
+                FocusSession.started_at < started_at,
+                db.and_(
+                    FocusSession.started_at == started_at,
+                    FocusSession.id < int(session_id),
+                ),
+            )
+        )
+    rows = (
+        query.order_by(FocusSession.started_at.desc(), FocusSession.id.desc())
+        .limit(limit)
+        .all()
+    )
+
+    items = [
+        {
+            "id": row.id,
+            "startedAt": row.started_at.isoformat(),
+            "duration": row.duration,
+            "mode": row.mode,
+            "outcome": row.outcome,
+            "partnerUsername": row.partner_username,
+        }
+        for row in rows
+    ]
+    next_cursor = None
+    if len(rows) == limit:
+        next_cursor = f"{rows[-1].started_at.isoformat()}_{rows[-1].id}"
+    return items, next_cursor
+
+
+@app.route("/api/leaderboard", methods=["GET"])
+def get_leaderboard():
+    limit = min(request.args.get("limit", 10, type=int), app.config["LEADERBOARD_SIZE"])
+    offset = max(request.args.get("offset", 0, type=int), 0)
+
+    if leaderboard.needs_reload():
+        # 走 total_focus_time 索引，只读取前 N 行
+        rows = (
+            db.session.query(User.id, User.username, User.total_focus_time)
+            .order_by(User.total_focus_time.desc())
+            .limit(app.config["LEADERBOARD_SIZE"])
+            .all()
+        )
+        leaderboard.reload(rows)
+
+    return jsonify({"leaderboard": leaderboard.top(max(limit, 0), offset)})
+
+
 if __name__ == "__main__":
-    socketio.run(app, debug=True)
+    socketio.run(
+        app,
+        host=os.environ.get("HOST", "127.0.0.1"),
+        port=int(os.environ.get("PORT", 5000)),
+        debug=os.environ.get("FLASK_DEBUG", "1") == "1",
+    )
@@ -0,0 +1,64 @@
+"""/api/user/stats 读取基准：无缓存、读穿缓存、带 If-None-Match 的条件请求。
+
+    python benchmarks/bench_cache.py --requests 5000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault(
+    "DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+)
+os.environ["SOCKETIO_ASYNC_MODE"] = "threading"
+
+import app as server  # noqa: E402
+
+
+def run(client, headers, requests, conditional):
+    etag = None
+    not_modified = 0
+    start = time.perf_counter()
+    for _ in range(requests):
+        request_headers = dict(headers)
+        if conditional and etag:
+            request_headers["If-None-Match"] = etag
+        response = client.get("/api/user/stats", headers=request_headers)
+        etag = response.headers.get("ETag")
+        not_modified += response.status_code == 304
+    return requests / (time.perf_counter() - start), not_modified
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+
+    client = server.app.test_client()
+    response = client.post(
+        "/api/register", json={"username": f"bench-{uuid.uuid4().hex}", "password": "x"}
+    )
+    headers = {"Authorization": f"Bearer {response.get_json()['token']}"}
+
+    cache = server.stats_cache
+    for name, maxsize, conditional in [
+        ("uncached", 0, False),
+        ("cached", 10000, False),
+        ("cached + If-None-Match", 10000, True),
+    ]:
+        cache.maxsize = maxsize
+        cache.invalidate([])
+        cache.hits = cache.misses = 0
+        rate, not_modified = run(client, headers, args.requests, conditional)
+        print(
+            f"{name:<24} {rate:>8,.0f} req/sec  "
+            f"hit rate={cache.stats()['hitRate']:.1%}  304s={not_modified}"
+        )
+
+
+if __name__ == "__main__":
+    main()
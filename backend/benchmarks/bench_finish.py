@@ -0,0 +1,112 @@
+"""会话结算基准：旧的三次请求对比 /api/sessions/finish 一次请求。
+
+通过 Flask test client 走完整的路由和 JWT 校验，报告每次结算的平均延迟、
+HTTP 请求数、数据库事务（commit）数和写语句数。
+
+    python benchmarks/bench_finish.py --sessions 2000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault(
+    "DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+)
+os.environ["SOCKETIO_ASYNC_MODE"] = "threading"
+
+from sqlalchemy import event  # noqa: E402
+
+import app as server  # noqa: E402
+
+counters = {"commits": 0, "writes": 0}
+
+
+def count_statements(conn, cursor, statement, parameters, context, executemany):
+    if not statement.lstrip().upper().startswith("SELECT"):
+        counters["writes"] += 1
+
+
+def count_commits(conn):
+    counters["commits"] += 1
+
+
+def check(response):
+    # 只统计成功的请求，避免把错误响应的延迟当成结果
+    assert response.status_code == 200, (response.status_code, response.get_json())
+    return response
+
+
+def old_flow(client, headers, duration):
+    # focus.tsx 之前的做法：客户端算奖励，再分三次请求
+    check(
+        client.post(
+            "/api/coins/update", json={"amount": duration // 60 * 2}, headers=headers
+        )
+    )
+    check(
+        client.post(
+            "/api/focus/complete", json={"focusTime": duration / 60}, headers=headers
+        )
+    )
+    check(client.get("/api/user/stats", headers=headers))
+    return 3
+
+
+def new_flow(client, headers, duration):
+    check(
+        client.post(
+            "/api/sessions/finish",
+            json={"duration": duration, "mode": "buddy", "completed": True},
+            headers={**headers, "Idempotency-Key": uuid.uuid4().hex},
+        )
+    )
+    return 1
+
+
+def run(flow, sessions):
+    client = server.app.test_client()
+    response = client.post(
+        "/api/register", json={"username": f"bench-{uuid.uuid4().hex}", "password": "x"}
+    )
+    headers = {"Authorization": f"Bearer {response.get_json()['token']}"}
+
+    counters.update(commits=0, writes=0)
+    requests = 0
+    start = time.perf_counter()
+    for _ in range(sessions):
+        requests += flow(client, headers, 1800)
+    elapsed = time.perf_counter() - start
+    return {
+        "latency_ms": elapsed / sessions * 1000,
+        "requests": requests / sessions,
+        "commits": counters["commits"] / sessions,
+        "writes": counters["writes"] / sessions,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sessions", type=int, default=2000)
+    args = parser.parse_args()
+
+    with server.app.app_context():
+        engine = server.db.engine
+    event.listen(engine, "before_cursor_execute", count_statements)
+    event.listen(engine, "commit", count_commits)
+
+    print(f"{'flow':<22} {'ms/session':>10} {'requests':>9} {'commits':>8} {'writes':>7}")
+    for name, flow in [("3 requests (old)", old_flow), ("/api/sessions/finish", new_flow)]:
+        result = run(flow, args.sessions)
+        print(
+            f"{name:<22} {result['latency_ms']:>10.2f} {result['requests']:>9.0f} "
+            f"{result['commits']:>8.2f} {result['writes']:>7.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""历史记录与排行榜基准：专注记录从 1 万增长到 100 万条时，分页查询延迟应保持平稳。
+
+记录通过 LedgerBatcher 后台任务的同一提交路径（_commit：账本、统计、专注记录和
+小时/天汇总 upsert）批量生成；开始前先经由 /api/sessions/finish 和 /api/focus/complete
+各完成一次专注，确认端点可用且记录出现在历史中。
+
+    python benchmarks/bench_history.py --sessions 1000000 --users 2000
+"""
+import argparse
+import datetime
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault(
+    "DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+)
+os.environ["SOCKETIO_ASYNC_MODE"] = "threading"
+
+from flask_jwt_extended import create_access_token  # noqa: E402
+
+import app as server  # noqa: E402
+
+
+def create_users(count):
+    with server.app.app_context():
+        users = [
+            server.User(username=f"bench-{uuid.uuid4().hex}", password="x")
+            for _ in range(count)
+        ]
+        server.db.session.add_all(users)
+        server.db.session.commit()
+        return [user.id for user in users]
+
+
+def check_endpoints(client, token):
+    headers = {"Authorization": f"Bearer {token}"}
+    response = client.post(
+        "/api/sessions/finish",
+        json={"duration": 1800, "mode": "buddy", "completed": True, "partnerLeft": False},
+        headers=headers,
+    )
+    assert response.status_code == 200, (response.status_code, response.get_json())
+    response = client.post(
+        "/api/focus/complete", json={"focusTime": 45, "mode": "solo"}, headers=headers
+    )
+    assert response.status_code == 200, (response.status_code, response.get_json())
+
+    history = client.get("/api/user/history?granularity=session", headers=headers)
+    assert history.status_code == 200
+    assert len(history.get_json()["items"]) == 2, history.get_json()
+    stats = client.get("/api/user/stats", headers=headers).get_json()
+    assert stats["totalSessions"] == 2 and stats["totalFocusTime"] == 75, stats
+
+
+def add_sessions(user_ids, count, chunk=10000):
+    start = datetime.datetime(2024, 1, 1)
+    with server.app.app_context():
+        for offset in range(0, count, chunk):
+            entries = []
+            for _ in range(min(chunk, count - offset)):
+                minutes = random.choice([30, 45, 60, 120])
+                outcome = random.choice(["success", "success", "partner_left", "quit"])
+                focus_time = 0 if outcome == "quit" else minutes
+                entries.append(
+                    server.LedgerEntry(
+                        random.choice(user_ids),
+                        0,
+                        "bench",
+                        sessions=1 if focus_time else 0,
+                        focus_time=focus_time,
+                        session=server.FocusRecord(
+                            started_at=start
+                            + datetime.timedelta(minutes=random.randrange(365 * 24 * 60)),
+                            duration=minutes * 60,
+                            mode=random.choice(["solo", "buddy"]),
+                            outcome=outcome,
+                            focus_time=focus_time,
+                        ),
+                    )
+                )
+            results = server.ledger._commit(entries)
+            assert all(result and result["applied"] for result in results)
+
+
+def measure(client, tokens, samples):
+    def timed(url, token):
+        start = time.perf_counter()
+        response = client.get(url, headers={"Authorization": f"Bearer {token}"})
+        elapsed = (time.perf_counter() - start) * 1000
+        return response.get_json(), elapsed
+
+    results = {"day": [], "day_page4": [], "session": [], "leaderboard": []}
+    for _ in range(samples):
+        token = random.choice(tokens)
+        data, elapsed = timed("/api/user/history?granularity=day&limit=30", token)
+        results["day"].append(elapsed)
+        for _ in range(3):
+            if not data["nextCursor"]:
+                break
+            data, elapsed = timed(
+                f"/api/user/history?granularity=day&limit=30&before={data['nextCursor']}",
+                token,
+            )
+        results["day_page4"].append(elapsed)
+        results["session"].append(
+            timed("/api/user/history?granularity=session&limit=30", token)[1]
+        )
+        results["leaderboard"].append(timed("/api/leaderboard?limit=10", token)[1])
+    return {name: statistics.median(values) for name, values in results.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sessions", type=int, default=1000000)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--samples", type=int, default=200)
+    args = parser.parse_args()
+
+    user_ids = create_users(args.users)
+    with server.app.app_context():
+        tokens = [create_access_token(identity=user_id) for user_id in user_ids]
+    client = server.app.test_client()
+    check_endpoints(client, tokens[0])
+
+    checkpoints = [n for n in (10000, 100000, 1000000) if n < args.sessions]
+    checkpoints.append(args.sessions)
+
+    print(
+        f"{'sessions':>10} {'day p50':>9} {'page4 p50':>10} {'session p50':>12} "
+        f"{'leaderboard p50':>16}  (ms)"
+    )
+    inserted = 0
+    for checkpoint in checkpoints:
+        add_sessions(user_ids, checkpoint - inserted)
+        inserted = checkpoint
+        server.leaderboard._loaded_at = None  # 每个检查点重新从数据库加载一次
+        result = measure(client, tokens, args.samples)
+        print(
+            f"{checkpoint:>10,} {result['day']:>9.2f} {result['day_page4']:>10.2f} "
+            f"{result['session']:>12.2f} {result['leaderboard']:>16.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""金币写入基准：逐请求 commit（旧实现）对比 LedgerBatcher 批量提交。
+
+多个线程同时给同一批用户加金币，报告 writes/sec，并检查最终余额：
+旧实现的读-改-写会丢失增量，账本实现应当既不丢失也不因重试而重复记账；
+夹杂在批次中的非法条目只让它自己失败。
+
+    python benchmarks/bench_ledger.py --threads 16 --writes 500
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 使用临时数据库和真正的线程，才能观察到并发写入的竞争
+os.environ.setdefault(
+    "DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+)
+os.environ["SOCKETIO_ASYNC_MODE"] = "threading"
+
+import app as server  # noqa: E402
+
+
+def create_users(count):
+    with server.app.app_context():
+        users = [
+            server.User(username=f"bench-{uuid.uuid4().hex}", password="x", coins=0)
+            for _ in range(count)
+        ]
+        server.db.session.add_all(users)
+        server.db.session.commit()
+        return [user.id for user in users]
+
+
+def balances(user_ids):
+    with server.app.app_context():
+        return sum(server.User.query.get(user_id).coins for user_id in user_ids)
+
+
+def per_request_commit(user_id, amount, key):
+    # 旧的 /api/coins/update 路径
+    with server.app.app_context():
+        user = server.User.query.get(user_id)
+        user.coins += amount
+        server.db.session.commit()
+
+
+def ledger_submit(user_id, amount, key):
+    server.ledger.submit(server.LedgerEntry(user_id, amount, "bench", key))
+
+
+def run(write, threads, writes, users, retry, poison=False):
+    user_ids = create_users(users)
+    errors = []
+    poison_errors = []
+
+    def worker(index):
+        for i in range(writes):
+            key = f"{index}-{i}"
+            try:
+                write(user_ids[i % users], 1, key)
+                if retry and i % 2 == 0:
+                    write(user_ids[i % users], 1, key)  # 模拟客户端重试
+            except Exception as e:
+                errors.append(e)
+            if poison and i % 50 == 0:
+                # 超出数据库整数范围的条目，与其他用户的写入落在同一批次
+                try:
+                    write(user_ids[i % users], 10**20, f"poison-{key}")
+                except OverflowError as e:
+                    poison_errors.append(e)
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    expected = threads * writes
+    return {
+        "writes_per_sec": expected / elapsed,
+        "lost": expected - balances(user_ids),
+        "errors": len(errors),
+        "poison_errors": len(poison_errors),
+        "poison_expected": threads * len(range(0, writes, 50)) if poison else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--writes", type=int, default=500, help="每个线程的写入次数")
+    parser.add_argument("--users", type=int, default=8)
+    args = parser.parse_args()
+
+    print(f"database: {server.app.config['SQLALCHEMY_DATABASE_URI']}")
+    failed = []
+    for name, write, retry, poison in [
+        ("per-request commit", per_request_commit, False, False),
+        ("ledger group commit", ledger_submit, False, False),
+        ("ledger + retries", ledger_submit, True, False),
+        ("ledger + bad entries", ledger_submit, False, True),
+    ]:
+        result = run(write, args.threads, args.writes, args.users, retry, poison)
+        print(
+            f"{name:<20} {result['writes_per_sec']:>10,.0f} writes/sec  "
+            f"lost={result['lost']}  errors={result['errors']}"
+        )
+        # 旧实现预期会丢失增量，只检查账本实现
+        if write is ledger_submit and (
+            result["lost"] != 0
+            or result["errors"] != 0
+            or result["poison_errors"] != result["poison_expected"]
+        ):
+            failed.append(name)
+
+    if failed:
+        sys.exit(f"FAILED: {', '.join(failed)} (lost < 0 means a retried key was credited twice)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""登录风暴基准：大量并发登录时的登录 p99 延迟，以及已连接用户看到的 socket 事件延迟。
+
+后台若干对 socket 客户端不断用唯一的 focus_time 发起匹配，测量从 start_matching
+到 match_success 的往返时间；同时大量线程并发调用 /api/login。密码哈希如果阻塞
+eventlet hub，socket 延迟会随登录风暴一起飙升。
+
+    python benchmarks/bench_login.py --logins 400 --concurrency 32
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import socketio
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from server import boot, percentile  # noqa: E402
+
+
+def probe_socket_latency(base_url, stop, samples):
+    # 一对已连接的“伙伴”，反复完成一次匹配往返
+    first, second = socketio.Client(), socketio.Client()
+    matched = threading.Event()
+    second.on("match_success", lambda data: matched.set())
+    first.connect(base_url)
+    second.connect(base_url)
+
+    while not stop.is_set():
+        focus_time = uuid.uuid4().int % 10**9
+        first.emit("start_matching", {"focus_time": focus_time, "username": "a"})
+        time.sleep(0.01)
+        matched.clear()
+        start = time.perf_counter()
+        second.emit("start_matching", {"focus_time": focus_time, "username": "b"})
+        if matched.wait(timeout=10):
+            samples.append((time.perf_counter() - start) * 1000)
+        time.sleep(0.05)
+
+    first.disconnect()
+    second.disconnect()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--logins", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--hash-workers", default="4")
+    args = parser.parse_args()
+
+    with boot(env={"PASSWORD_HASH_WORKERS": args.hash_workers}) as base_url:
+        username, password = f"bench-{uuid.uuid4().hex}", "secret"
+        requests.post(
+            f"{base_url}/api/register", json={"username": username, "password": password}
+        ).raise_for_status()
+
+        stop = threading.Event()
+        idle_samples, storm_samples = [], []
+        probe = threading.Thread(
+            target=probe_socket_latency, args=(base_url, stop, idle_samples)
+        )
+        probe.start()
+        time.sleep(2)
+
+        # 登录风暴期间的 socket 延迟单独统计
+        baseline_count = len(idle_samples)
+        login_latencies = []
+
+        def login(_):
+            start = time.perf_counter()
+            requests.post(
+                f"{base_url}/api/login", json={"username": username, "password": password}
+            ).raise_for_status()
+            login_latencies.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            list(pool.map(login, range(args.logins)))
+        elapsed = time.perf_counter() - start
+        storm_samples = idle_samples[baseline_count:]
+        del idle_samples[baseline_count:]
+
+        stop.set()
+        probe.join()
+
+    print(f"logins/sec:           {args.logins / elapsed:,.1f}")
+    print(
+        f"login latency:        p50={percentile(login_latencies, 50):.1f}ms "
+        f"p99={percentile(login_latencies, 99):.1f}ms"
+    )
+    print(
+        f"socket latency idle:  p50={percentile(idle_samples, 50):.1f}ms "
+        f"p99={percentile(idle_samples, 99):.1f}ms"
+    )
+    print(
+        f"socket latency storm: p50={percentile(storm_samples, 50):.1f}ms "
+        f"p99={percentile(storm_samples, 99):.1f}ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Matchmaker 微基准：配对吞吐量（matches/sec）和超时精度。
+
+    python benchmarks/bench_matchmaking.py --waiters 50000
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from matchmaking import Matchmaker  # noqa: E402
+
+FOCUS_TIMES = [30, 1800, 2700, 3600, 7200]
+
+
+def bench_matching(waiters):
+    matchmaker = Matchmaker(timeout=30)
+    # 2 * waiters 个用户依次进入，按 focus_time 两两配对
+    sids = [f"a{i}" for i in range(waiters)] + [f"b{i}" for i in range(waiters)]
+    focus_times = [FOCUS_TIMES[i * len(FOCUS_TIMES) // waiters] for i in range(waiters)]
+
+    start = time.perf_counter()
+    matches = 0
+    for i, sid in enumerate(sids):
+        if matchmaker.enqueue(sid, focus_times[i % waiters], sid):
+            matches += 1
+    elapsed = time.perf_counter() - start
+    assert matches == waiters and len(matchmaker) == 0
+    return matches / elapsed
+
+
+def bench_cancel(waiters):
+    matchmaker = Matchmaker(timeout=30)
+    for i in range(waiters):
+        matchmaker.enqueue(f"a{i}", i, f"user{i}")
+
+    start = time.perf_counter()
+    for i in range(waiters):
+        matchmaker.cancel(f"a{i}")
+    elapsed = time.perf_counter() - start
+    assert len(matchmaker) == 0
+    return waiters / elapsed
+
+
+def bench_timeouts(waiters, timeout):
+    matchmaker = Matchmaker(timeout=timeout)
+    enqueued_at = {}
+    for i in range(waiters):
+        sid = f"a{i}"
+        enqueued_at[sid] = matchmaker.clock()
+        # 每个 focus_time 只放一个人，保证全部超时而不是配对
+        matchmaker.enqueue(sid, i, f"user{i}")
+
+    # 与服务器中的 run_match_timer 相同的循环
+    lateness = []
+    while len(matchmaker):
+        deadline = matchmaker.next_deadline()
+        time.sleep(max(deadline - matchmaker.clock(), 0))
+        now = matchmaker.clock()
+        for sid in matchmaker.expire(now):
+            lateness.append((now - enqueued_at[sid] - timeout) * 1000)
+
+    lateness.sort()
+    return {
+        "p50_ms": statistics.median(lateness),
+        "p99_ms": lateness[int(len(lateness) * 0.99) - 1],
+        "max_ms": lateness[-1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--waiters", type=int, default=50000)
+    parser.add_argument("--timeout", type=float, default=0.5)
+    args = parser.parse_args()
+
+    print(f"waiters:            {args.waiters}")
+    print(f"matches/sec:        {bench_matching(args.waiters):,.0f}")
+    print(f"cancels/sec:        {bench_cancel(args.waiters):,.0f}")
+    accuracy = bench_timeouts(args.waiters, args.timeout)
+    print(
+        "timeout lateness:   p50={p50_ms:.2f}ms p99={p99_ms:.2f}ms max={max_ms:.2f}ms".format(
+            **accuracy
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""多 worker 共享匹配队列的吞吐量基准。
+
+每个 worker 是一个独立进程，通过同一个 Redis 原子地配对，报告不同 worker 数量下
+的 matches/sec 以及跨 worker 配对的比例。
+
+    REDIS_URL=redis://localhost:6379/15 python benchmarks/bench_scaleout.py --workers 1,2,4
+
+不设置 REDIS_URL 时使用 fakeredis 在单进程内验证配对逻辑（不反映扩展性）。
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from matchmaking import RedisMatchmaker  # noqa: E402
+
+FOCUS_TIMES = [30, 1800, 2700, 3600, 7200]
+
+
+def connect(redis_url):
+    if redis_url:
+        import redis
+
+        return redis.Redis.from_url(redis_url, decode_responses=True)
+
+    import fakeredis
+
+    return fakeredis.FakeRedis(decode_responses=True)
+
+
+def run_worker(redis_url, prefix, worker, operations, start_barrier, results):
+    matchmaker = RedisMatchmaker(connect(redis_url), prefix=prefix)
+    start_barrier.wait()
+
+    matches = cross_worker = 0
+    start = time.perf_counter()
+    for i in range(operations):
+        match = matchmaker.enqueue(
+            f"w{worker}-{i}", FOCUS_TIMES[i % len(FOCUS_TIMES)], f"user{i}"
+        )
+        if match:
+            matches += 1
+            if not match[0].startswith(f"w{worker}-"):
+                cross_worker += 1
+    results.put((matches, cross_worker, time.perf_counter() - start))
+
+
+def bench(redis_url, workers, operations):
+    prefix = f"bench:{{{uuid.uuid4().hex}}}:"
+    start_barrier = multiprocessing.Barrier(workers)
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(
+            target=run_worker,
+            args=(redis_url, prefix, worker, operations, start_barrier, results),
+        )
+        for worker in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    outcomes = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    client = connect(redis_url)
+    for key in client.scan_iter(match=prefix + "*"):
+        client.delete(key)
+
+    matches = sum(outcome[0] for outcome in outcomes)
+    cross_worker = sum(outcome[1] for outcome in outcomes)
+    elapsed = max(outcome[2] for outcome in outcomes)
+    return matches / elapsed, cross_worker / max(matches, 1)
+
+
+def bench_fake(operations):
+    matchmaker = RedisMatchmaker(connect(None))
+    matches = 0
+    start = time.perf_counter()
+    for i in range(operations):
+        if matchmaker.enqueue(f"s{i}", FOCUS_TIMES[i % len(FOCUS_TIMES)], f"user{i}"):
+            matches += 1
+    elapsed = time.perf_counter() - start
+    assert matches == operations // 2 and len(matchmaker) == operations % 2
+    return matches / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--redis-url", default=os.environ.get("REDIS_URL"))
+    parser.add_argument("--workers", default="1,2,4,8")
+    parser.add_argument("--operations", type=int, default=20000, help="每个 worker 的入队次数")
+    args = parser.parse_args()
+
+    if not args.redis_url:
+        print(f"fakeredis (single process): {bench_fake(args.operations):,.0f} matches/sec")
+        return
+
+    print(f"{'workers':>8} {'matches/sec':>14} {'cross-worker':>13}")
+    for workers in [int(w) for w in args.workers.split(",")]:
+        rate, cross = bench(args.redis_url, workers, args.operations)
+        print(f"{workers:>8} {rate:>14,.0f} {cross:>12.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""BuddyRegistry 微基准：配对/心跳/断线重连的吞吐量，以及超时通知是否准确。
+
+    python benchmarks/bench_sessions.py --pairs 10000
+    REDIS_URL=redis://localhost:6379/15 python benchmarks/bench_sessions.py --redis
+
+--redis 时对 RedisBuddyRegistry 运行同样的检查；不设置 REDIS_URL 时使用 fakeredis。
+"""
+import argparse
+import functools
+import os
+import statistics
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sessions import BuddyRegistry, RedisBuddyRegistry  # noqa: E402
+
+make_registry = BuddyRegistry
+
+
+def connect(redis_url):
+    if redis_url:
+        import redis
+
+        return redis.Redis.from_url(redis_url, decode_responses=True)
+
+    import fakeredis
+
+    return fakeredis.FakeRedis(decode_responses=True)
+
+
+def redis_registry(client, **kwargs):
+    # 每次使用新的前缀，互不干扰
+    return RedisBuddyRegistry(
+        client, prefix=f"bench-{uuid.uuid4().hex}:{{buddy}}:", **kwargs
+    )
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def paired(pairs, heartbeat_timeout=30, grace_period=30, **kwargs):
+    registry = make_registry(
+        heartbeat_timeout=heartbeat_timeout, grace_period=grace_period, **kwargs
+    )
+    # 每项为 (session_id, a 的 resume token, b 的 resume token)
+    sessions = [
+        registry.pair(f"a{i}", f"alice{i}", f"b{i}", f"bob{i}") for i in range(pairs)
+    ]
+    return registry, sessions
+
+
+def bench_pair(pairs):
+    start = time.perf_counter()
+    registry, _ = paired(pairs)
+    elapsed = time.perf_counter() - start
+    assert len(registry) == pairs
+    assert registry.partner_of(f"a{pairs - 1}")[1:] == (f"b{pairs - 1}", f"bob{pairs - 1}")
+    return pairs / elapsed
+
+
+def bench_heartbeat(pairs, rounds=10):
+    registry, _ = paired(pairs)
+    sids = [f"{side}{i}" for i in range(pairs) for side in "ab"]
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for sid in sids:
+            registry.heartbeat(sid)
+    elapsed = time.perf_counter() - start
+    assert registry.heartbeat("unknown") is False
+    return len(sids) * rounds / elapsed
+
+
+def bench_resume(pairs):
+    registry, sessions = paired(pairs)
+
+    start = time.perf_counter()
+    for i, (session_id, token, _) in enumerate(sessions):
+        registry.disconnect(f"a{i}")
+        resumed = registry.resume(f"a{i}-2", session_id, token)
+        assert resumed == (f"alice{i}", f"b{i}", f"bob{i}")
+    elapsed = time.perf_counter() - start
+    assert len(registry) == pairs
+    assert registry.leave(f"b0") == "a0-2"
+    return pairs / elapsed
+
+
+def check_expiry(pairs):
+    # 用假时钟确认每种情况都只通知该通知的伙伴
+    clock = FakeClock()
+    registry, sessions = paired(pairs, clock=clock, heartbeat_timeout=30, grace_period=10)
+    quarter = pairs // 4
+    steady = range(quarter)  # 双方一直有心跳
+    silent = range(quarter, quarter * 2)  # a 不再心跳
+    resumed = range(quarter * 2, quarter * 3)  # a 断线后 5 秒内重连
+    gone = range(quarter * 3, pairs)  # a 断线后不再回来
+
+    for i in list(resumed) + list(gone):
+        registry.disconnect(f"a{i}")
+
+    expected = {10: gone, 30: silent, 35: resumed}
+    for t in range(5, 55, 5):
+        clock.now = t
+        if t == 5:
+            for i in resumed:
+                registry.resume(f"a{i}-2", *sessions[i][:2])
+        for i in range(pairs):
+            registry.heartbeat(f"b{i}")
+            if i in steady:
+                registry.heartbeat(f"a{i}")
+        notified = set(registry.expire())
+        want = {f"b{i}" for i in expected.get(t, ())}
+        assert notified == want, (t, len(notified), len(want))
+
+    assert len(registry) == quarter
+    # 心跳都停止后，每个会话只通知一次（先超时的一方的伙伴）
+    assert len(registry.expire(1000)) == quarter
+    assert len(registry) == 0 and registry.expire(2000) == []
+
+
+def check_flapping(reconnects):
+    # 反复断线重连不应在堆里累积记录，也不应影响超时判断
+    clock = FakeClock()
+    registry, ((session_id, token, _),) = paired(
+        1, clock=clock, heartbeat_timeout=30, grace_period=10
+    )
+    for i in range(reconnects):
+        registry.disconnect(f"a0-{i}" if i else "a0")
+        registry.resume(f"a0-{i + 1}", session_id, token)
+    if isinstance(registry, BuddyRegistry):
+        assert len(registry._timers) <= 1024 + 4, len(registry._timers)
+    assert registry.next_deadline() == 30
+
+    clock.now = 20
+    registry.heartbeat("b0")
+    clock.now = 30
+    assert registry.expire() == ["b0"]  # a 停止心跳，b 收到通知
+    assert len(registry) == 0 and registry.next_deadline() is None
+
+
+def check_resume_token():
+    # 只有配对时拿到的 token 能恢复对应成员，伙伴知道 session_id 和用户名也不能顶替
+    registry, ((session_id, token_a, token_b),) = paired(1)
+    registry.disconnect("a0")
+    for bad in ("alice0", "", None, token_a[:-1], ["x"]):
+        assert registry.resume("mallory", session_id, bad) is None, bad
+    assert registry.resume("mallory", "other-session", token_a) is None
+    assert registry.partner_of("b0") == (session_id, None, "alice0")
+
+    # 伙伴用自己的 token 只能回到自己的位置
+    assert registry.resume("b0-2", session_id, token_b) == ("bob0", None, "alice0")
+    assert registry.resume("a0-2", session_id, token_a) == ("alice0", "b0-2", "bob0")
+    assert registry.partner_of("b0-2") == (session_id, "a0-2", "alice0")
+
+    # 会话结束后 token 失效
+    registry.leave("a0-2")
+    assert registry.resume("a0-3", session_id, token_a) is None
+
+
+def bench_expiry_latency(pairs, timeout):
+    # 与服务器中的 run_buddy_monitor 相同的循环，测量超时后多久发出通知
+    registry = make_registry(heartbeat_timeout=timeout)
+    paired_at = {}
+    for i in range(pairs):
+        paired_at[f"a{i}"] = paired_at[f"b{i}"] = registry.clock()
+        registry.pair(f"a{i}", f"alice{i}", f"b{i}", f"bob{i}")
+
+    lateness = []
+    while len(registry):
+        deadline = registry.next_deadline()
+        time.sleep(max(deadline - registry.clock(), 0))
+        now = registry.clock()
+        for sid in registry.expire(now):
+            lateness.append((now - paired_at[sid] - timeout) * 1000)
+
+    assert len(lateness) == pairs
+    lateness.sort()
+    return {
+        "p50_ms": statistics.median(lateness),
+        "p99_ms": lateness[int(len(lateness) * 0.99) - 1],
+        "max_ms": lateness[-1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pairs", type=int, default=10000)
+    parser.add_argument("--timeout", type=float, default=0.5)
+    parser.add_argument("--redis", action="store_true", help="测试 RedisBuddyRegistry")
+    args = parser.parse_args()
+
+    global make_registry
+    if args.redis:
+        make_registry = functools.partial(
+            redis_registry, connect(os.environ.get("REDIS_URL"))
+        )
+
+    print(f"registry:           {'redis' if args.redis else 'in-process'}")
+    print(f"pairs:              {args.pairs}")
+    print(f"pairs/sec:          {bench_pair(args.pairs):,.0f}")
+    print(f"heartbeats/sec:     {bench_heartbeat(args.pairs):,.0f}")
+    print(f"resumes/sec:        {bench_resume(args.pairs):,.0f}")
+    check_expiry(args.pairs)
+    check_flapping(args.pairs)
+    check_resume_token()
+    print("expiry:             ok")
+    latency = bench_expiry_latency(args.pairs, args.timeout)
+    print(
+        "expiry lateness:    p50={p50_ms:.2f}ms p99={p99_ms:.2f}ms max={max_ms:.2f}ms".format(
+            **latency
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""SQLite 混合读写负载：默认设置（DB_TUNING=0）对比 WAL + busy timeout + 连接池。
+
+每种设置分别在 threading 和 eventlet 模式下、各自独立的进程中运行：多个后台任务按比例
+执行登录式查询（按 username）、统计查询（按 id）和逐请求提交的原子更新，报告 ops/sec
+和 "database is locked" 错误数。后台任务由 socketio.start_background_task 启动，
+eventlet 模式下与服务器一样是 green thread；每次查询后让出一次，模拟请求处理期间
+占用着连接，任务数超过连接池上限时能暴露出与 eventlet 不协作的等待。
+
+    python benchmarks/bench_storage.py --threads 64 --seconds 10
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+
+def run_workload(async_mode, threads, seconds, write_ratio, users):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    os.environ["SOCKETIO_ASYNC_MODE"] = async_mode
+
+    from sqlalchemy.exc import OperationalError, TimeoutError
+
+    import app as server
+
+    with server.app.app_context():
+        accounts = [
+            server.User(username=f"bench-{uuid.uuid4().hex}", password="x")
+            for _ in range(users)
+        ]
+        server.db.session.add_all(accounts)
+        server.db.session.commit()
+        accounts = [(user.id, user.username) for user in accounts]
+
+    users_table = server.User.__table__
+    counts = {"reads": 0, "writes": 0, "locked": 0, "errors": 0}
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+
+    def worker():
+        local = dict.fromkeys(counts, 0)
+        while time.monotonic() < deadline:
+            user_id, username = random.choice(accounts)
+            with server.app.app_context():
+                try:
+                    if random.random() < write_ratio:
+                        server.db.session.execute(
+                            users_table.update()
+                            .where(users_table.c.id == user_id)
+                            .values(coins=users_table.c.coins + 1)
+                        )
+                        server.db.session.commit()
+                        local["writes"] += 1
+                    elif random.random() < 0.5:
+                        server.User.query.filter_by(username=username).first()
+                        local["reads"] += 1
+                    else:
+                        server.User.query.get(user_id)
+                        local["reads"] += 1
+                    # 连接在 app context 结束时才归还
+                    server.socketio.sleep(0)
+                except OperationalError as e:
+                    server.db.session.rollback()
+                    local["locked" if "locked" in str(e) else "errors"] += 1
+                except TimeoutError:
+                    local["errors"] += 1
+        with lock:
+            for key, value in local.items():
+                counts[key] += value
+
+    workers = [server.socketio.start_background_task(worker) for _ in range(threads)]
+    # engineio 的 EventletThread.join 对尚未开始运行的 green thread 会直接返回，先让出一次
+    server.socketio.sleep(0)
+    for thread in workers:
+        thread.join()
+
+    counts["ops_per_sec"] = (counts["reads"] + counts["writes"]) / seconds
+    print(json.dumps(counts))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--threads", type=int, default=64, help="并发任务数，默认超过连接池上限 30")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--write-ratio", type=float, default=0.2)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--worker", choices=["threading", "eventlet"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_workload(args.worker, args.threads, args.seconds, args.write_ratio, args.users)
+        return
+
+    print(
+        f"{'mode':<10} {'async':<10} {'ops/sec':>10} {'reads':>9} {'writes':>8} "
+        f"{'locked':>7} {'errors':>7}"
+    )
+    stuck = False
+    for mode, tuning in [("default", "0"), ("tuned", "1")]:
+        for async_mode in ["threading", "eventlet"]:
+            env = {
+                **os.environ,
+                "DB_TUNING": tuning,
+                "DATABASE_URL": f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}",
+            }
+            try:
+                output = subprocess.run(
+                    [sys.executable, __file__, "--worker", async_mode] + sys.argv[1:],
+                    env=env,
+                    capture_output=True,
+                    text=True,
+                    check=True,
+                    timeout=args.seconds * 2 + 60,
+                ).stdout
+            except subprocess.TimeoutExpired:
+                # 连接池的等待阻塞了 eventlet 的 hub 时，整个进程会卡住
+                print(f"{mode:<10} {async_mode:<10} {'hung':>10}")
+                stuck = True
+                continue
+            result = json.loads(output.strip().splitlines()[-1])
+            print(
+                f"{mode:<10} {async_mode:<10} {result['ops_per_sec']:>10,.0f} "
+                f"{result['reads']:>9} {result['writes']:>8} {result['locked']:>7} "
+                f"{result['errors']:>7}"
+            )
+    if stuck:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+"""REST + Socket.IO 负载测试。
+
+run: 在本地启动后端（或使用 --url 指定的服务器），模拟大量客户端走完真实流程：
+注册/登录、查询金币和统计、start_matching → match_success / match_timeout、
+session_complete / leaving_session 通知伙伴、/api/sessions/finish 结算。
+按路由和 socket 事件统计吞吐量和 p50/p95/p99 延迟，结果写入 JSON。
+
+compare: 对比两次 run 的 JSON 结果，p95 变慢或吞吐量下降超过阈值时返回非零退出码。
+
+    python benchmarks/loadtest.py run --clients 2000 --concurrency 200 --output new.json
+    python benchmarks/loadtest.py compare baseline.json new.json --threshold 10
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import sys
+import time
+import uuid
+from collections import Counter, defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from server import boot, percentile  # noqa: E402
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.errors = Counter()
+
+    def record(self, name, started):
+        self.samples[name].append((time.perf_counter() - started) * 1000)
+
+    @contextlib.asynccontextmanager
+    async def timed(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.errors[name] += 1
+            raise
+        self.record(name, started)
+
+    def summary(self, elapsed):
+        metrics = {}
+        for name in sorted(set(self.samples) | set(self.errors)):
+            samples = self.samples[name]
+            metrics[name] = {
+                "count": len(samples),
+                "errors": self.errors[name],
+                "throughput": len(samples) / elapsed,
+                "mean_ms": sum(samples) / len(samples) if samples else 0.0,
+                "p50_ms": percentile(samples, 50),
+                "p95_ms": percentile(samples, 95),
+                "p99_ms": percentile(samples, 99),
+            }
+        return metrics
+
+
+class LoadTest:
+    def __init__(self, base_url, args):
+        self.base_url = base_url
+        self.args = args
+        self.run_id = uuid.uuid4().hex[:8]
+        self.recorder = Recorder()
+        self.sent_at = {}  # key: 发送通知的 sid，value: 发送时刻
+        self.http = None
+
+    async def request(self, method, path, expected=(200, 201), **kwargs):
+        async with self.recorder.timed(f"{method} {path.split('?')[0]}"):
+            async with self.http.request(method, self.base_url + path, **kwargs) as response:
+                body = await response.json(content_type=None)
+                if response.status not in expected:
+                    raise RuntimeError(f"{method} {path} returned {response.status}")
+                return body
+
+    async def simulate_client(self, index):
+        import socketio
+
+        args = self.args
+        credentials = {"username": f"load-{self.run_id}-{index}", "password": "secret"}
+        await self.request("POST", "/api/register", json=credentials)
+        login = await self.request("POST", "/api/login", json=credentials)
+        headers = {"Authorization": f"Bearer {login['token']}"}
+        await self.request("GET", "/api/coins", headers=headers)
+        await self.request("GET", "/api/user/stats", headers=headers)
+
+        loop = asyncio.get_running_loop()
+        matched, notified = loop.create_future(), loop.create_future()
+        sio = socketio.AsyncClient(reconnection=False)
+
+        def resolve(future, value):
+            if not future.done():
+                future.set_result(value)
+
+        sio.on("match_success", lambda data: resolve(matched, ("match_success", data)))
+        sio.on("match_timeout", lambda *_: resolve(matched, ("match_timeout", None)))
+        sio.on("partner_complete", lambda *_: resolve(notified, "partner_complete"))
+        sio.on("partner_left", lambda *_: resolve(notified, "partner_left"))
+
+        async with self.recorder.timed("socket connect"):
+            await sio.connect(self.base_url, transports=["websocket"])
+
+        try:
+            # 一部分客户端选择无人使用的时长，走超时流程
+            solo = index % 100 < args.timeout_percent
+            focus_time = uuid.uuid4().int % 10**9 if solo else args.focus_time
+            started = time.perf_counter()
+            await sio.emit(
+                "start_matching", {"focus_time": focus_time, "username": credentials["username"]}
+            )
+            try:
+                event, data = await asyncio.wait_for(matched, args.event_timeout)
+            except asyncio.TimeoutError:
+                self.recorder.errors["match"] += 1
+                return
+            self.recorder.record(event, started)
+
+            mode = "solo"
+            partner_left = False
+            if event == "match_success":
+                mode = "buddy"
+                partner_id = data["partner_id"]
+                # 服务端的 request.sid 是命名空间 sid，与 sio.sid（Engine.IO sid）不同
+                sid = sio.get_sid()
+                if sid < partner_id:
+                    # 每对中由 sid 较小的一方发出通知，另一方测量收到的延迟
+                    notify = "session_complete" if index % 2 else "leaving_session"
+                    self.sent_at[sid] = time.perf_counter()
+                    await sio.emit(notify, {"partner_id": partner_id})
+                else:
+                    try:
+                        received = await asyncio.wait_for(notified, args.event_timeout)
+                    except asyncio.TimeoutError:
+                        self.recorder.errors["partner notification"] += 1
+                    else:
+                        self.recorder.record(received, self.sent_at.pop(partner_id))
+                        partner_left = received == "partner_left"
+
+            await self.request(
+                "POST",
+                "/api/sessions/finish",
+                headers={**headers, "Idempotency-Key": uuid.uuid4().hex},
+                json={
+                    "duration": 1800,
+                    "mode": mode,
+                    "completed": True,
+                    "partnerLeft": partner_left,
+                },
+            )
+        finally:
+            await sio.disconnect()
+
+    async def run(self):
+        import aiohttp
+
+        slots = asyncio.Semaphore(self.args.concurrency)
+
+        async def guarded(index):
+            async with slots:
+                try:
+                    await self.simulate_client(index)
+                except Exception as e:
+                    self.recorder.errors["client"] += 1
+                    if self.args.verbose:
+                        print(f"client {index} failed: {e!r}")
+
+        connector = aiohttp.TCPConnector(limit=self.args.concurrency)
+        async with aiohttp.ClientSession(connector=connector) as self.http:
+            started = time.perf_counter()
+            await asyncio.gather(*(guarded(i) for i in range(self.args.clients)))
+            elapsed = time.perf_counter() - started
+
+        return {
+            "meta": {
+                "run_id": self.run_id,
+                "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "elapsed_s": elapsed,
+                "clients": self.args.clients,
+                "concurrency": self.args.concurrency,
+                "timeout_percent": self.args.timeout_percent,
+                "python": platform.python_version(),
+            },
+            "metrics": self.recorder.summary(elapsed),
+        }
+
+
+def print_results(results):
+    print(
+        f"{'metric':<28} {'count':>7} {'errors':>6} {'per sec':>9} "
+        f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+    )
+    for name, metric in results["metrics"].items():
+        print(
+            f"{name:<28} {metric['count']:>7} {metric['errors']:>6} "
+            f"{metric['throughput']:>9.1f} {metric['p50_ms']:>8.1f} "
+            f"{metric['p95_ms']:>8.1f} {metric['p99_ms']:>8.1f}"
+        )
+    print(f"elapsed: {results['meta']['elapsed_s']:.1f}s")
+
+
+def command_run(args):
+    env = dict(item.split("=", 1) for item in args.env)
+    env.setdefault("MATCH_TIMEOUT", str(args.match_timeout))
+
+    async def run(base_url):
+        return await LoadTest(base_url, args).run()
+
+    if args.url:
+        results = asyncio.run(run(args.url))
+    else:
+        with boot(env=env) as base_url:
+            results = asyncio.run(run(base_url))
+
+    print_results(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"results written to {args.output}")
+
+
+def command_compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)["metrics"]
+    with open(args.candidate) as f:
+        candidate = json.load(f)["metrics"]
+
+    regressions = []
+    print(f"{'metric':<28} {'p95 base':>9} {'p95 new':>9} {'Δp95':>8} {'Δthroughput':>12}")
+    for name in sorted(set(baseline) & set(candidate)):
+        old, new = baseline[name], candidate[name]
+        p95_change = change(old["p95_ms"], new["p95_ms"])
+        throughput_change = change(old["throughput"], new["throughput"])
+        flags = []
+        if p95_change > args.threshold:
+            flags.append("slower")
+        if throughput_change < -args.threshold:
+            flags.append("lower throughput")
+        if new["errors"] > old["errors"]:
+            flags.append("more errors")
+        if flags:
+            regressions.append(name)
+        print(
+            f"{name:<28} {old['p95_ms']:>9.1f} {new['p95_ms']:>9.1f} "
+            f"{p95_change:>+7.1f}% {throughput_change:>+11.1f}%  {', '.join(flags)}"
+        )
+
+    for name in sorted(set(baseline) ^ set(candidate)):
+        print(f"{name:<28} only in {'baseline' if name in baseline else 'candidate'}")
+
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) above {args.threshold}%")
+        sys.exit(1)
+
+
+def change(old, new):
+    if not old:
+        return 0.0
+    return (new - old) / old * 100
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="run the load test")
+    run.add_argument("--url", help="use a running server instead of booting one")
+    run.add_argument("--clients", type=int, default=1000)
+    run.add_argument("--concurrency", type=int, default=100)
+    run.add_argument("--focus-time", type=int, default=1800)
+    run.add_argument(
+        "--timeout-percent", type=int, default=5, help="clients that go through match_timeout"
+    )
+    run.add_argument("--match-timeout", type=float, default=3, help="MATCH_TIMEOUT for the booted server")
+    run.add_argument("--event-timeout", type=float, default=60)
+    run.add_argument("--env", action="append", default=[], help="KEY=VALUE for the booted server")
+    run.add_argument("--output")
+    run.add_argument("--verbose", action="store_true")
+    run.set_defaults(func=command_run)
+
+    compare = commands.add_parser("compare", help="compare two result files")
+    compare.add_argument("baseline")
+    compare.add_argument("candidate")
+    compare.add_argument("--threshold", type=float, default=10, help="percent")
+    compare.set_defaults(func=command_compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
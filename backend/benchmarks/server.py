@@ -0,0 +1,54 @@
+"""在子进程中启动后端，供需要真实 HTTP / Socket.IO 服务器的基准使用。"""
+import contextlib
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextlib.contextmanager
+def boot(env=None, port=None, startup_timeout=30):
+    """启动 app.py，返回服务器地址；默认使用临时 SQLite 数据库。"""
+    port = port or free_port()
+    server_env = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}",
+        "HOST": "127.0.0.1",
+        "PORT": str(port),
+        "FLASK_DEBUG": "0",
+        **(env or {}),
+    }
+    process = subprocess.Popen([sys.executable, "app.py"], cwd=BACKEND_DIR, env=server_env)
+    try:
+        deadline = time.monotonic() + startup_timeout
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f"server exited with code {process.returncode}")
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError("server did not start in time")
+                time.sleep(0.1)
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def percentile(samples, p):
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+import logs
+
+log = logs.get_logger("cache")
+
+StatsSnapshot = namedtuple("StatsSnapshot", ["stats", "etag"])
+
+
+class StatsCache:
+    """按用户缓存统计快照（LRU + TTL），写入路径提交后调用 invalidate。
+
+    缓存只在当前进程内有效；多 worker 部署时由 RedisInvalidations 把失效广播到
+    其他 worker，广播丢失时快照最多滞后 ttl 秒。
+    """
+
+    def __init__(self, maxsize=10000, ttl=30, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key: user_id, value: (expires_at, snapshot)
+        # 只记录正在读取数据库的用户：user_id -> [进行中的 loader 数, 期间的失效次数]
+        self._loading = {}
+        self._lock = threading.Lock()
+
+    def get_or_load(self, user_id, loader):
+        """返回用户的 StatsSnapshot；未命中时调用 loader() 读取数据库。"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] > self.clock():
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            state = self._loading.setdefault(user_id, [0, 0])
+            state[0] += 1
+            generation = state[1]
+
+        snapshot = None
+        try:
+            stats = loader()
+            if stats is not None:
+                snapshot = StatsSnapshot(stats, make_etag(user_id, stats))
+        finally:
+            with self._lock:
+                state = self._loading[user_id]
+                state[0] -= 1
+                if not state[0]:
+                    del self._loading[user_id]
+                # 读取期间该用户发生过写入则不缓存，避免旧值覆盖失效
+                if snapshot is not None and state[1] == generation and self.maxsize > 0:
+                    self._entries[user_id] = (self.clock() + self.ttl, snapshot)
+                    self._entries.move_to_end(user_id)
+                    while len(self._entries) > self.maxsize:
+                        self._entries.popitem(last=False)
+        return snapshot
+
+    def invalidate(self, user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+                state = self._loading.get(user_id)
+                if state is not None:
+                    state[1] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            for state in self._loading.values():
+                state[1] += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class RedisInvalidations:
+    """多 worker 部署时通过 Redis pub/sub 把统计缓存的失效广播给所有 worker。
+
+    publish 先使本地缓存失效再广播；每个 worker 在后台任务中运行 listen。
+    """
+
+    def __init__(self, client, cache, channel="focuser:stats-invalidate", retry_interval=1):
+        self.client = client
+        self.cache = cache
+        self.channel = channel
+        self.retry_interval = retry_interval
+
+    def publish(self, user_ids):
+        user_ids = list(user_ids)
+        self.cache.invalidate(user_ids)
+        if not user_ids:
+            return
+        try:
+            self.client.publish(self.channel, json.dumps(user_ids))
+        except Exception as e:
+            # 广播失败时其他 worker 的快照最多滞后 ttl 秒，不影响本次写入
+            log.warning("stats_invalidation_publish_failed", error=str(e))
+
+    def listen(self):
+        while True:
+            pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.subscribe(self.channel)
+                # 订阅之前（或断线期间）的广播已经收不到了，整体清空一次
+                self.cache.clear()
+                for message in pubsub.listen():
+                    self.cache.invalidate(json.loads(message["data"]))
+            except Exception as e:
+                log.warning("stats_invalidation_listener_failed", error=str(e))
+            finally:
+                pubsub.close()
+            time.sleep(self.retry_interval)
+
+
+def make_etag(user_id, stats):
+    values = ":".join(f"{key}={stats[key]}" for key in sorted(stats))
+    return hashlib.sha1(f"{user_id}:{values}".encode()).hexdigest()[:20]
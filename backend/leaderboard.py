@@ -0,0 +1,61 @@
+import bisect
+import threading
+import time
+
+
+class Leaderboard:
+    """内存中的前 N 名（按累计专注时间）。
+
+    累计时间只增不减，因此只需维护当前前 N 名：名单外的用户只有在分数超过第 N 名
+    时才会进入。其他 worker 的写入通过定期从数据库 reload 同步。
+    """
+
+    def __init__(self, size=100, refresh_interval=60, clock=time.monotonic):
+        self.size = size
+        self.refresh_interval = refresh_interval
+        self.clock = clock
+        self._ranking = []  # 升序排列的 (-score, user_id)
+        self._members = {}  # key: user_id, value: (score, username)
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def update(self, user_id, username, score):
+        with self._lock:
+            member = self._members.get(user_id)
+            if member is not None:
+                del self._ranking[bisect.bisect_left(self._ranking, (-member[0], user_id))]
+            elif len(self._ranking) >= self.size and (-score, user_id) >= self._ranking[-1]:
+                return
+
+            bisect.insort(self._ranking, (-score, user_id))
+            self._members[user_id] = (score, username)
+            if len(self._ranking) > self.size:
+                _, evicted = self._ranking.pop()
+                del self._members[evicted]
+
+    def top(self, limit, offset=0):
+        with self._lock:
+            return [
+                {
+                    "rank": offset + i + 1,
+                    "userId": user_id,
+                    "username": self._members[user_id][1],
+                    "totalFocusTime": -neg_score,
+                }
+                for i, (neg_score, user_id) in enumerate(
+                    self._ranking[offset : offset + limit]
+                )
+            ]
+
+    def needs_reload(self):
+        return (
+            self._loaded_at is None
+            or self.clock() - self._loaded_at > self.refresh_interval
+        )
+
+    def reload(self, rows):
+        """用数据库中的前 N 名 (user_id, username, score) 替换当前名单。"""
+        with self._lock:
+            self._ranking = sorted((-score, user_id) for user_id, _, score in rows)
+            self._members = {user_id: (score, username) for user_id, username, score in rows}
+            self._loaded_at = self.clock()
@@ -0,0 +1,303 @@
+import time
+from collections import namedtuple
+
+from sqlalchemy import select, update
+
+import logs
+
+log = logs.get_logger("ledger")
+
+# amount 为金币变化；sessions / focus_time 为统计增量；session 为要记录的 FocusRecord。
+# 带相同 idempotency_key 的重试只会生效一次。
+LedgerEntry = namedtuple(
+    "LedgerEntry",
+    [
+        "user_id",
+        "amount",
+        "reason",
+        "idempotency_key",
+        "sessions",
+        "focus_time",
+        "session",
+    ],
+    defaults=[None, 0, 0, None],
+)
+
+# 一次专注记录；duration 为秒，focus_time 为计入统计的分钟数
+FocusRecord = namedtuple(
+    "FocusRecord",
+    ["started_at", "duration", "mode", "outcome", "focus_time", "partner_username"],
+    defaults=[None],
+)
+
+ROLLUP_GRANULARITIES = ("hour", "day")
+
+
+def bucket_start(moment, granularity):
+    if granularity == "hour":
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+class LedgerBatcher:
+    """把金币和统计的写入合并成批量事务（group commit）。
+
+    请求线程调用 submit() 后等待结果；一个后台任务从队列里取出当前积压的所有条目，
+    在同一个事务中追加账本记录并以 `coins = coins + ?` 的方式原子地更新余额和统计。
+    带 session 的条目同时写入专注记录，并增量更新按小时/天的汇总表。
+    """
+
+    def __init__(
+        self,
+        app,
+        db,
+        user_model,
+        ledger_model,
+        socketio,
+        session_model=None,
+        rollup_model=None,
+        max_batch=500,
+        on_commit=None,
+        commit_histogram=None,
+        batch_histogram=None,
+    ):
+        self.app = app
+        self.db = db
+        self.user_model = user_model
+        self.ledger_model = ledger_model
+        self.session_model = session_model
+        self.rollup_model = rollup_model
+        self.socketio = socketio
+        self.max_batch = max_batch
+        # 提交后以 {user_id: 最新统计} 调用，用于缓存失效和排行榜更新
+        self.on_commit = on_commit
+        # 可选的 metrics.Histogram，记录提交耗时和每批条目数
+        self.commit_histogram = commit_histogram
+        self.batch_histogram = batch_histogram
+        self._queue = socketio.server.eio.create_queue()
+        self._queue_empty = socketio.server.eio.get_queue_empty_exception()
+        self._started = False
+
+    def submit(self, entry):
+        """写入一条记录并等待其所在批次提交。
+
+        返回 {"applied", "coins", "totalSessions", "totalFocusTime"}；
+        用户不存在时返回 None。
+        """
+        if not self._started:
+            self._started = True
+            self.socketio.start_background_task(self._run)
+
+        reply = self.socketio.server.eio.create_queue()
+        self._queue.put((entry, reply))
+        result = reply.get()
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except self._queue_empty:
+                    break
+
+            with self.app.app_context():
+                try:
+                    results = self._commit([entry for entry, _ in batch])
+                except Exception:
+                    log.exception("ledger_commit_failed", batch_size=len(batch))
+                    # 整批已回滚；逐条重试，只让出错的条目失败，不影响同批的其他用户
+                    results = []
+                    for entry, _ in batch:
+                        try:
+                            results.extend(self._commit([entry]))
+                        except Exception as e:
+                            log.warning(
+                                "ledger_entry_failed", user_id=entry.user_id, error=repr(e)
+                            )
+                            results.append(e)
+
+            for (_, reply), result in zip(batch, results):
+                reply.put(result)
+
+    def _commit(self, entries):
+        try:
+            results, changed = self._apply(entries)
+            started = time.perf_counter()
+            self.db.session.commit()
+        except Exception:
+            self.db.session.rollback()
+            raise
+        if self.commit_histogram:
+            self.commit_histogram.observe(time.perf_counter() - started, "ledger")
+        if self.batch_histogram:
+            self.batch_histogram.observe(len(entries))
+        if self.on_commit:
+            # 已经提交，回调失败不能让条目被重试而重复记账
+            try:
+                self.on_commit(changed)
+            except Exception:
+                log.exception("ledger_on_commit_failed", users=len(changed))
+        return results
+
+    def _apply(self, entries):
+        session = self.db.session
+        users = self.user_model.__table__
+        ledger = self.ledger_model.__table__
+
+        user_ids = {entry.user_id for entry in entries}
+        existing = set(
+            session.execute(select(users.c.id).where(users.c.id.in_(user_ids))).scalars()
+        )
+
+        insert = self._insert(ledger).on_conflict_do_nothing(
+            index_elements=["user_id", "idempotency_key"]
+        )
+        applied = []
+        deltas = {}
+        records = []
+        for entry in entries:
+            if entry.user_id not in existing:
+                applied.append(None)
+                continue
+
+            if entry.amount or entry.idempotency_key is not None:
+                inserted = session.execute(
+                    insert.values(
+                        user_id=entry.user_id,
+                        amount=entry.amount,
+                        reason=entry.reason,
+                        idempotency_key=entry.idempotency_key,
+                    )
+                ).rowcount
+                if not inserted:
+                    # 重复的 idempotency_key：已经记过账，不再累加
+                    applied.append(False)
+                    continue
+
+            coins, sessions, focus_time = deltas.get(entry.user_id, (0, 0, 0))
+            deltas[entry.user_id] = (
+                coins + entry.amount,
+                sessions + entry.sessions,
+                focus_time + entry.focus_time,
+            )
+            if entry.session is not None:
+                records.append((entry.user_id, entry.session))
+            applied.append(True)
+
+        if records:
+            self._record_sessions(records)
+
+        for user_id, (coins, sessions, focus_time) in deltas.items():
+            session.execute(
+                update(users)
+                .where(users.c.id == user_id)
+                .values(
+                    coins=users.c.coins + coins,
+                    total_sessions=users.c.total_sessions + sessions,
+                    total_focus_time=users.c.total_focus_time + focus_time,
+                )
+            )
+
+        stats = {
+            row.id: row
+            for row in session.execute(
+                select(
+                    users.c.id,
+                    users.c.username,
+                    users.c.coins,
+                    users.c.total_sessions,
+                    users.c.total_focus_time,
+                ).where(users.c.id.in_(existing))
+            )
+        }
+
+        results = []
+        for entry, was_applied in zip(entries, applied):
+            if was_applied is None:
+                results.append(None)
+                continue
+            row = stats[entry.user_id]
+            results.append(
+                {
+                    "applied": was_applied,
+                    "coins": row.coins,
+                    "totalSessions": row.total_sessions,
+                    "totalFocusTime": row.total_focus_time,
+                }
+            )
+
+        changed = {
+            user_id: {
+                "username": stats[user_id].username,
+                "coins": stats[user_id].coins,
+                "totalSessions": stats[user_id].total_sessions,
+                "totalFocusTime": stats[user_id].total_focus_time,
+            }
+            for user_id in deltas
+        }
+        return results, changed
+
+    def _record_sessions(self, sessions):
+        db_session = self.db.session
+        db_session.execute(
+            self.session_model.__table__.insert(),
+            [
+                {
+                    "user_id": user_id,
+                    "started_at": record.started_at,
+                    "duration": record.duration,
+                    "mode": record.mode,
+                    "outcome": record.outcome,
+                    "partner_username": record.partner_username,
+                }
+                for user_id, record in sessions
+            ],
+        )
+
+        # 同一批次内先按 (用户, 粒度, 时间段) 合并，再逐个 upsert 累加到汇总表
+        buckets = {}
+        for user_id, record in sessions:
+            for granularity in ROLLUP_GRANULARITIES:
+                key = (user_id, granularity, bucket_start(record.started_at, granularity))
+                counts = buckets.setdefault(key, [0, 0, 0, 0])
+                counts[0] += 1
+                counts[1] += record.outcome != "quit"
+                counts[2] += record.mode == "buddy"
+                counts[3] += record.focus_time
+
+        rollups = self.rollup_model.__table__
+        upsert = self._insert(rollups)
+        upsert = upsert.on_conflict_do_update(
+            index_elements=["user_id", "granularity", "bucket_start"],
+            set_={
+                "sessions": rollups.c.sessions + upsert.excluded.sessions,
+                "completed_sessions": rollups.c.completed_sessions
+                + upsert.excluded.completed_sessions,
+                "buddy_sessions": rollups.c.buddy_sessions
+                + upsert.excluded.buddy_sessions,
+                "focus_time": rollups.c.focus_time + upsert.excluded.focus_time,
+            },
+        )
+        for (user_id, granularity, start), counts in buckets.items():
+            db_session.execute(
+                upsert.values(
+                    user_id=user_id,
+                    granularity=granularity,
+                    bucket_start=start,
+                    sessions=counts[0],
+                    completed_sessions=counts[1],
+                    buddy_sessions=counts[2],
+                    focus_time=counts[3],
+                )
+            )
+
+    def _insert(self, table):
+        if self.db.engine.dialect.name == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        return insert(table)
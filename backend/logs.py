@@ -0,0 +1,66 @@
+import datetime
+import json
+import logging
+import random
+
+_debug_sample_rate = 1.0
+
+
+class JsonFormatter(logging.Formatter):
+    """每条日志一行 JSON：时间、级别、logger、事件名以及附带的字段。"""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.datetime.utcfromtimestamp(record.created).isoformat() + "Z",
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "event": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class EventLogger:
+    """log.info("match_success", sid=..., partner_id=...) 形式的结构化日志。
+
+    debug 级别用于热路径，按 configure() 设置的比例采样；未开启 debug 时几乎没有开销。
+    """
+
+    def __init__(self, logger):
+        self.logger = logger
+
+    def debug(self, event, **fields):
+        if self.logger.isEnabledFor(logging.DEBUG) and (
+            _debug_sample_rate >= 1 or random.random() < _debug_sample_rate
+        ):
+            self.logger.debug(event, extra={"fields": fields})
+
+    def info(self, event, **fields):
+        self.logger.info(event, extra={"fields": fields})
+
+    def warning(self, event, **fields):
+        self.logger.warning(event, extra={"fields": fields})
+
+    def error(self, event, **fields):
+        self.logger.error(event, extra={"fields": fields})
+
+    def exception(self, event, **fields):
+        self.logger.exception(event, extra={"fields": fields})
+
+
+def configure(level="INFO", debug_sample_rate=1.0):
+    global _debug_sample_rate
+    _debug_sample_rate = debug_sample_rate
+
+    handler = logging.StreamHandler()
+    handler.setFormatter(JsonFormatter())
+    root = logging.getLogger("focuser")
+    root.handlers[:] = [handler]
+    root.setLevel(level.upper())
+    root.propagate = False
+
+
+def get_logger(name):
+    return EventLogger(logging.getLogger(f"focuser.{name}"))
@@ -0,0 +1,228 @@
+import heapq
+import itertools
+import time
+from collections import OrderedDict
+
+
+class Matchmaker:
+    """按 focus_time 分组的 FIFO 配对队列，所有等待者共用一个超时堆。
+
+    enqueue / cancel 都是 O(1)（超时堆为 O(log n)），已取消或已配对的
+    用户在堆里留下的旧记录会在 expire() 时跳过，并在堆过大时整体重建。
+    """
+
+    def __init__(self, timeout=30, clock=time.monotonic):
+        self.timeout = timeout
+        self.clock = clock
+        self._queues = {}  # key: focus_time, value: OrderedDict(sid -> username)
+        self._waiting = {}  # key: sid, value: (focus_time, deadline)
+        self._timers = []  # 堆: (deadline, seq, sid)
+        self._seq = itertools.count()
+
+    def __len__(self):
+        return len(self._waiting)
+
+    def __contains__(self, sid):
+        return sid in self._waiting
+
+    def enqueue(self, sid, focus_time, username):
+        # 同一连接重复发起匹配时，先撤销之前的排队
+        self.cancel(sid)
+
+        queue = self._queues.get(focus_time)
+        if queue:
+            partner_id, partner_username = queue.popitem(last=False)
+            del self._waiting[partner_id]
+            if not queue:
+                del self._queues[focus_time]
+            return partner_id, partner_username
+
+        deadline = self.clock() + self.timeout
+        self._queues.setdefault(focus_time, OrderedDict())[sid] = username
+        self._waiting[sid] = (focus_time, deadline)
+        heapq.heappush(self._timers, (deadline, next(self._seq), sid))
+        return None
+
+    def cancel(self, sid):
+        entry = self._waiting.pop(sid, None)
+        if entry is None:
+            return False
+
+        focus_time = entry[0]
+        queue = self._queues[focus_time]
+        del queue[sid]
+        if not queue:
+            del self._queues[focus_time]
+
+        # 旧记录过多时重建堆，避免大量取消后堆无限增长
+        if len(self._timers) > 2 * len(self._waiting) + 1024:
+            self._timers = [
+                timer for timer in self._timers if self._is_live(timer)
+            ]
+            heapq.heapify(self._timers)
+        return True
+
+    def expire(self, now=None):
+        """移除所有已超时的等待者，返回它们的 sid 列表。"""
+        if now is None:
+            now = self.clock()
+
+        expired = []
+        while self._timers and self._timers[0][0] <= now:
+            timer = heapq.heappop(self._timers)
+            if self._is_live(timer):
+                self.cancel(timer[2])
+                expired.append(timer[2])
+        return expired
+
+    def next_deadline(self):
+        while self._timers and not self._is_live(self._timers[0]):
+            heapq.heappop(self._timers)
+        return self._timers[0][0] if self._timers else None
+
+    def depths(self):
+        return {focus_time: len(queue) for focus_time, queue in self._queues.items()}
+
+    def _is_live(self, timer):
+        deadline, _, sid = timer
+        entry = self._waiting.get(sid)
+        return entry is not None and entry[1] == deadline
+
+
+# Redis 版本：多个 worker 共享同一组队列，配对和超时都在 Lua 脚本里原子完成，
+# 同一个等待者只会被一个 worker 取出。
+# 队列清空时同时从 focus_times 里移除该时长，避免客户端提交的各种 focus_time 无限累积
+_REMOVE_WAITER = """
+local function drop_if_empty(queue, focus_times, focus_time)
+    if redis.call('ZCARD', queue) == 0 then
+        redis.call('SREM', focus_times, focus_time)
+    end
+end
+
+local function remove_waiter(prefix, waiting, names, timers, focus_times, sid)
+    local focus_time = redis.call('HGET', waiting, sid)
+    if not focus_time then
+        return false
+    end
+    local queue = prefix .. 'queue:' .. focus_time
+    redis.call('ZREM', queue, sid)
+    drop_if_empty(queue, focus_times, focus_time)
+    redis.call('HDEL', waiting, sid)
+    redis.call('HDEL', names, sid)
+    redis.call('ZREM', timers, sid)
+    return true
+end
+"""
+
+_ENQUEUE_SCRIPT = _REMOVE_WAITER + """
+local waiting, names, timers, seq, focus_times = KEYS[1], KEYS[2], KEYS[3], KEYS[4], KEYS[5]
+local prefix, sid, focus_time, username, deadline = ARGV[1], ARGV[2], ARGV[3], ARGV[4], ARGV[5]
+
+remove_waiter(prefix, waiting, names, timers, focus_times, sid)
+
+local queue = prefix .. 'queue:' .. focus_time
+local head = redis.call('ZPOPMIN', queue)
+if head[1] then
+    local partner_id = head[1]
+    drop_if_empty(queue, focus_times, focus_time)
+    local partner_username = redis.call('HGET', names, partner_id)
+    redis.call('HDEL', waiting, partner_id)
+    redis.call('HDEL', names, partner_id)
+    redis.call('ZREM', timers, partner_id)
+    return {partner_id, partner_username}
+end
+
+redis.call('ZADD', queue, redis.call('INCR', seq), sid)
+redis.call('SADD', focus_times, focus_time)
+redis.call('HSET', waiting, sid, focus_time)
+redis.call('HSET', names, sid, username)
+redis.call('ZADD', timers, deadline, sid)
+return false
+"""
+
+_CANCEL_SCRIPT = _REMOVE_WAITER + """
+if remove_waiter(ARGV[1], KEYS[1], KEYS[2], KEYS[3], KEYS[4], ARGV[2]) then
+    return 1
+end
+return 0
+"""
+
+_EXPIRE_SCRIPT = _REMOVE_WAITER + """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[3], '-inf', ARGV[2], 'LIMIT', 0, ARGV[3])
+for _, sid in ipairs(expired) do
+    remove_waiter(ARGV[1], KEYS[1], KEYS[2], KEYS[3], KEYS[4], sid)
+end
+return expired
+"""
+
+
+class RedisMatchmaker:
+    """与 Matchmaker 接口相同，状态保存在 Redis（或兼容 Redis 的服务）中。"""
+
+    def __init__(self, client, timeout=30, prefix="focuser:{mm}:", batch_size=1000):
+        self.client = client
+        self.timeout = timeout
+        self.clock = time.time  # 多个进程/机器之间共享截止时间，不能用 monotonic
+        self.prefix = prefix
+        self.batch_size = batch_size
+        self._keys = [
+            prefix + "waiting",
+            prefix + "names",
+            prefix + "timers",
+            prefix + "seq",
+            prefix + "focus_times",
+        ]
+        # cancel / expire 用到的键：waiting, names, timers, focus_times
+        self._remove_keys = self._keys[:3] + self._keys[4:]
+        self._enqueue = client.register_script(_ENQUEUE_SCRIPT)
+        self._cancel = client.register_script(_CANCEL_SCRIPT)
+        self._expire = client.register_script(_EXPIRE_SCRIPT)
+
+    def __len__(self):
+        return self.client.hlen(self._keys[0])
+
+    def __contains__(self, sid):
+        return bool(self.client.hexists(self._keys[0], sid))
+
+    def enqueue(self, sid, focus_time, username):
+        match = self._enqueue(
+            keys=self._keys,
+            args=[
+                self.prefix,
+                sid,
+                focus_time,
+                username or "",
+                self.clock() + self.timeout,
+            ],
+        )
+        if not match:
+            return None
+        partner_id, partner_username = match
+        return partner_id, partner_username or None
+
+    def cancel(self, sid):
+        return bool(self._cancel(keys=self._remove_keys, args=[self.prefix, sid]))
+
+    def expire(self, now=None):
+        if now is None:
+            now = self.clock()
+
+        expired = []
+        while True:
+            batch = self._expire(
+                keys=self._remove_keys, args=[self.prefix, now, self.batch_size]
+            )
+            expired.extend(batch)
+            if len(batch) < self.batch_size:
+                return expired
+
+    def next_deadline(self):
+        head = self.client.zrange(self._keys[2], 0, 0, withscores=True)
+        return head[0][1] if head else None
+
+    def depths(self):
+        focus_times = sorted(self.client.smembers(self._keys[4]))
+        pipe = self.client.pipeline(transaction=False)
+        for focus_time in focus_times:
+            pipe.zcard(self.prefix + "queue:" + focus_time)
+        return dict(zip(focus_times, pipe.execute()))
@@ -0,0 +1,143 @@
+import bisect
+import time
+
+# 轻量的 Prometheus 文本格式指标。每个 worker 单独暴露 /metrics，由 Prometheus 分别抓取。
+# eventlet 下所有 green thread 共用一个 OS 线程，计数不加锁；threading 模式下极少量的
+# 并发自增可能丢失，对监控用途可以接受。
+
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+
+def _format_labels(labelnames, values, extra=""):
+    pairs = [
+        f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)
+    ]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _callback_samples(metric):
+    values = metric.callback() if metric.callback else metric._values
+    for labels, value in values.items():
+        if not isinstance(labels, tuple):
+            labels = (labels,)
+        yield metric.name, _format_labels(metric.labelnames, labels), value
+
+
+class Counter:
+    """用 inc() 计数；已有只增不减的计数（如缓存命中数）时可以传 callback 在抓取时取值。"""
+
+    type = "counter"
+
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+        self._values = {}
+
+    def inc(self, *labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        return _callback_samples(self)
+
+
+class Gauge:
+    """可以 set()，也可以在抓取时调用 callback 取值；callback 返回 {labels: value}。"""
+
+    type = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+        self._values = {}
+
+    def set(self, value, *labels):
+        self._values[labels] = value
+
+    def samples(self):
+        return _callback_samples(self)
+
+
+class Histogram:
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # key: labels, value: [各桶计数..., +Inf 计数, sum]
+
+    def observe(self, value, *labels):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 2)
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def time(self, *labels):
+        return _Timer(self, labels)
+
+    def samples(self):
+        for labels, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series):
+                cumulative += count
+                yield (
+                    self.name + "_bucket",
+                    _format_labels(self.labelnames, labels, f'le="{bound}"'),
+                    cumulative,
+                )
+            yield self.name + "_sum", _format_labels(self.labelnames, labels), series[-1]
+            yield self.name + "_count", _format_labels(self.labelnames, labels), cumulative
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, *args, **kwargs):
+        return self.register(Counter(*args, **kwargs))
+
+    def gauge(self, *args, **kwargs):
+        return self.register(Gauge(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs):
+        return self.register(Histogram(*args, **kwargs))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {value}")
+        return "\n".join(lines) + "\n"
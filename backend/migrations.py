@@ -0,0 +1,61 @@
+import datetime
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, Table, select
+
+import logs
+
+log = logs.get_logger("migrations")
+
+
+def _fill_null_user_counters(connection, tables):
+    # 早期的 user 表中这些列可以为 NULL，而 `coins = coins + ?` 遇到 NULL 结果仍为 NULL
+    users = tables["user"]
+    for column in (users.c.coins, users.c.total_sessions, users.c.total_focus_time):
+        connection.execute(users.update().where(column.is_(None)).values({column.name: 0}))
+
+
+def _index_ledger_by_user_and_time(connection, tables):
+    # 新库由 create_all 按模型创建该索引，这里只为旧库补建
+    for index in tables["coin_ledger"].indexes:
+        if index.name == "ix_coin_ledger_user_id_created_at":
+            index.create(connection, checkfirst=True)
+
+
+def _index_user_by_total_focus_time(connection, tables):
+    for index in tables["user"].indexes:
+        if index.name == "ix_user_total_focus_time":
+            index.create(connection, checkfirst=True)
+
+
+# (版本号, 说明, 迁移函数)，只能在末尾追加
+MIGRATIONS = [
+    (1, "fill NULL user counters", _fill_null_user_counters),
+    (2, "index coin_ledger by user and time", _index_ledger_by_user_and_time),
+    (3, "index user by total focus time", _index_user_by_total_focus_time),
+]
+
+
+def migrate(db):
+    """在 db.create_all() 之后运行尚未执行过的迁移。"""
+    versions = Table(
+        "schema_migrations",
+        MetaData(),
+        Column("version", Integer, primary_key=True),
+        Column("applied_at", DateTime, nullable=False),
+    )
+
+    with db.engine.begin() as connection:
+        versions.create(connection, checkfirst=True)
+        applied = set(connection.execute(select(versions.c.version)).scalars())
+
+        for version, description, upgrade in MIGRATIONS:
+            if version in applied:
+                continue
+            log.info("applying_migration", version=version, description=description)
+            upgrade(connection, db.metadata.tables)
+            connection.execute(
+                versions.insert().values(
+                    version=version, applied_at=datetime.datetime.utcnow()
+                )
+            )
+
@@ -0,0 +1,47 @@
+import concurrent.futures
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class PasswordHasher:
+    """在有界线程池中计算密码哈希，避免 PBKDF2 阻塞 eventlet 的 hub。
+
+    hashlib 计算 PBKDF2 时会释放 GIL，因此放到线程里执行时，其他 socket 事件可以
+    继续处理。max_workers 限制了同时进行的哈希数量，登录高峰时多余的请求会排队。
+    """
+
+    def __init__(self, method, salt_length=16, max_workers=4, async_mode=None):
+        self.method = method
+        self.salt_length = salt_length
+        # werkzeug 会把迭代次数等参数写进哈希前缀，用它来判断是否需要重新哈希
+        self.prefix = generate_password_hash("", method, salt_length).split("$", 1)[0]
+
+        if async_mode == "eventlet":
+            from eventlet import semaphore, tpool
+
+            slots = semaphore.Semaphore(max_workers)
+
+            def run(fn, *args):
+                with slots:
+                    return tpool.execute(fn, *args)
+
+        else:
+            executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=max_workers, thread_name_prefix="password-hash"
+            )
+
+            def run(fn, *args):
+                return executor.submit(fn, *args).result()
+
+        self._run = run
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method, self.salt_length)
+
+    def verify(self, stored_hash, password):
+        return self._run(check_password_hash, stored_hash, password)
+
+    def needs_rehash(self, stored_hash):
+        method, _, rest = stored_hash.partition("$")
+        salt = rest.partition("$")[0]
+        return method != self.prefix or len(salt) != self.salt_length
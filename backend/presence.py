@@ -0,0 +1,108 @@
+import time
+import uuid
+
+
+class Presence:
+    """当前进程内已连接的 socket 集合。"""
+
+    def __init__(self):
+        self._sids = set()
+
+    def __len__(self):
+        return len(self._sids)
+
+    def local_count(self):
+        return len(self._sids)
+
+    def __contains__(self, sid):
+        return sid in self._sids
+
+    def add(self, sid):
+        self._sids.add(sid)
+
+    def discard(self, sid):
+        self._sids.discard(sid)
+
+
+# 清理超过 worker_timeout 没有心跳的 worker：它们的 sid 从全局集合中移除
+_REAP_SCRIPT = """
+local sids, workers = KEYS[1], KEYS[2]
+local prefix = ARGV[1]
+local dead = redis.call('ZRANGEBYSCORE', workers, '-inf', ARGV[2])
+for _, worker in ipairs(dead) do
+    local key = prefix .. 'worker:' .. worker
+    for _, sid in ipairs(redis.call('SMEMBERS', key)) do
+        redis.call('SREM', sids, sid)
+    end
+    redis.call('DEL', key)
+    redis.call('ZREM', workers, worker)
+end
+return #dead
+"""
+
+
+class RedisPresence:
+    """所有 worker 共享的在线 socket 集合。
+
+    每个 worker 另外把自己的 sid 记在 worker:<id> 集合中，并定期调用 refresh() 刷新心跳；
+    进程崩溃来不及 discard 的 sid，会在 worker_timeout 后被其他 worker 的 refresh() 清理。
+    len() 是所有 worker 的总数，local_count() 只统计当前 worker。
+    """
+
+    def __init__(
+        self,
+        client,
+        prefix="focuser:{presence}:",
+        worker_timeout=30,
+        clock=time.time,
+    ):
+        self.client = client
+        self.prefix = prefix
+        self.worker_timeout = worker_timeout
+        self.clock = clock
+        self.worker_id = uuid.uuid4().hex
+        self._keys = [prefix + "sids", prefix + "workers"]
+        self._worker_key = prefix + "worker:" + self.worker_id
+        self._local = set()
+        self._registered = False
+        self._reap = client.register_script(_REAP_SCRIPT)
+
+    def __len__(self):
+        return self.client.scard(self._keys[0])
+
+    def local_count(self):
+        return len(self._local)
+
+    def __contains__(self, sid):
+        return bool(self.client.sismember(self._keys[0], sid))
+
+    def add(self, sid):
+        if not self._registered:
+            self.refresh()
+        self._local.add(sid)
+        pipe = self.client.pipeline()
+        pipe.sadd(self._keys[0], sid)
+        pipe.sadd(self._worker_key, sid)
+        pipe.execute()
+
+    def discard(self, sid):
+        self._local.discard(sid)
+        pipe = self.client.pipeline()
+        pipe.srem(self._keys[0], sid)
+        pipe.srem(self._worker_key, sid)
+        pipe.execute()
+
+    def refresh(self):
+        """刷新当前 worker 的心跳并清理失联的 worker，返回清理的 worker 数。"""
+        now = self.clock()
+        added = self.client.zadd(self._keys[1], {self.worker_id: now})
+        if added and self._registered and self._local:
+            # 心跳曾中断太久、已被其他 worker 当作失联清理，重新登记仍在线的 sid
+            pipe = self.client.pipeline()
+            pipe.sadd(self._keys[0], *self._local)
+            pipe.sadd(self._worker_key, *self._local)
+            pipe.execute()
+        self._registered = True
+        return self._reap(
+            keys=self._keys, args=[self.prefix, now - self.worker_timeout]
+        )
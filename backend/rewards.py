@@ -0,0 +1,30 @@
+import math
+
+# 与前端 app/services/rewards.ts 中的 calculateReward 规则保持一致
+
+
+def calculate_reward(focus_time, is_buddy, is_completed, partner_left):
+    """focus_time 为秒数，返回 {"points", "message", "type"}。"""
+    base_reward = math.floor(focus_time / 60 + 1)
+    points = base_reward
+    reward_type = "success"
+
+    if is_completed:
+        if is_buddy:
+            if partner_left:
+                points = math.floor(base_reward * 1.5)
+                message = f"Partner left but you made it! Earned {points} coins!"
+                reward_type = "partner_left"
+            else:
+                points = base_reward * 2
+                message = f"Great teamwork! Earned {points} coins!"
+        else:
+            message = f"Well done! Earned {points} coins!"
+    else:
+        points = -math.floor(base_reward * 0.2)
+        if is_buddy:
+            points *= 2
+        message = f"Gave up early. Lost {abs(points)} coins."
+        reward_type = "quit"
+
+    return {"points": points, "message": message, "type": reward_type}
@@ -0,0 +1,535 @@
+import heapq
+import hmac
+import itertools
+import secrets
+import time
+import uuid
+
+
+def new_resume_token():
+    # 只发给成员本人，断线重连时凭它回到原会话
+    return secrets.token_urlsafe(16)
+
+
+class _Member:
+    __slots__ = ("username", "sid", "token", "last_seen", "disconnected_at", "timer")
+
+    def __init__(self, username, sid, token, now):
+        self.username = username
+        self.sid = sid
+        self.token = token
+        self.last_seen = now
+        self.disconnected_at = None
+        self.timer = None  # 当前有效的堆记录序号，其余记录弹出时跳过
+
+
+class BuddyRegistry:
+    """服务端维护的进行中的配对会话。
+
+    按 sid 和用户名都可以 O(1) 找到会话和伙伴。已连接的成员超过 heartbeat_timeout
+    没有心跳，或断开后 grace_period 内没有用 resume() 重连，就会被移出会话，
+    expire() 返回需要通知 partner_left 的伙伴 sid。重连凭配对时发给每个成员的
+    resume token，伙伴知道 session_id 和用户名也无法顶替对方。
+    超时检查和 Matchmaker 一样使用共享的堆：每个成员只有一条有效记录，断线/重连产生的
+    旧记录在弹出时跳过；有效记录到期时若期间有过心跳，则按新的截止时间重新入堆。
+    """
+
+    def __init__(self, heartbeat_timeout=30, grace_period=30, clock=time.monotonic):
+        self.heartbeat_timeout = heartbeat_timeout
+        self.grace_period = grace_period
+        self.clock = clock
+        self._sessions = {}  # key: session_id, value: {username: _Member}
+        self._by_sid = {}  # key: sid, value: (session_id, username)
+        self._by_user = {}  # key: username, value: session_id
+        self._timers = []  # 堆: (deadline, seq, session_id, username)
+        self._seq = itertools.count()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def pair(self, sid, username, partner_sid, partner_username):
+        """登记一对新配对的用户，返回 (session_id, sid 的 resume token, 伙伴的 resume token)。"""
+        for member_sid in (sid, partner_sid):
+            self.leave(member_sid)
+
+        # 未提供用户名（或两端用户名相同）时用 sid 作为键，此时无法跨连接恢复
+        key = username or sid
+        partner_key = partner_username or partner_sid
+        if partner_key == key:
+            partner_key = partner_sid
+
+        now = self.clock()
+        session_id = uuid.uuid4().hex
+        tokens = new_resume_token(), new_resume_token()
+        self._sessions[session_id] = {}
+        for member_sid, member_key, token in zip(
+            (sid, partner_sid), (key, partner_key), tokens
+        ):
+            self._sessions[session_id][member_key] = _Member(
+                member_key, member_sid, token, now
+            )
+            self._by_sid[member_sid] = (session_id, member_key)
+            self._by_user[member_key] = session_id
+            self._schedule(now + self.heartbeat_timeout, session_id, member_key)
+        return (session_id, *tokens)
+
+    def heartbeat(self, sid):
+        member = self._member_by_sid(sid)
+        if member is None:
+            return False
+        member.last_seen = self.clock()
+        return True
+
+    def partner_of(self, sid):
+        """返回 (session_id, 伙伴 sid, 伙伴用户名)；伙伴暂时断开时 sid 为 None。"""
+        entry = self._by_sid.get(sid)
+        if entry is None:
+            return None
+        session_id, username = entry
+        partner = self._partner(session_id, username)
+        if partner is None:
+            return session_id, None, None
+        return session_id, partner.sid, partner.username
+
+    def session_of_user(self, username):
+        return self._by_user.get(username)
+
+    def leave(self, sid):
+        """成员主动离开：结束整个会话，返回需要通知 partner_left 的伙伴 sid。"""
+        entry = self._by_sid.get(sid)
+        if entry is None:
+            return None
+        partner = self._partner(*entry)
+        self._end(entry[0])
+        return partner.sid if partner else None
+
+    def complete(self, sid):
+        """成员完成专注：只移出该成员，伙伴继续；返回需要通知 partner_complete 的伙伴 sid。"""
+        entry = self._by_sid.get(sid)
+        if entry is None:
+            return None
+        session_id, username = entry
+        partner = self._partner(session_id, username)
+        self._remove(session_id, username)
+        return partner.sid if partner else None
+
+    def disconnect(self, sid):
+        """连接断开：保留成员，等待 grace_period 内重连。"""
+        entry = self._by_sid.pop(sid, None)
+        if entry is None:
+            return False
+        session_id, username = entry
+        member = self._sessions[session_id][username]
+        member.sid = None
+        member.disconnected_at = self.clock()
+        self._schedule(member.disconnected_at + self.grace_period, session_id, username)
+        return True
+
+    def resume(self, sid, session_id, resume_token):
+        """断线重连后恢复原会话，返回 (用户名, 伙伴 sid, 伙伴用户名)；会话已结束或
+        token 不对时返回 None。"""
+        if not isinstance(session_id, str) or not isinstance(resume_token, str):
+            return None
+        member = None
+        for candidate in self._sessions.get(session_id, {}).values():
+            if hmac.compare_digest(candidate.token.encode(), resume_token.encode()):
+                member = candidate
+        if member is None:
+            return None
+        username = member.username
+
+        if member.sid is not None:
+            self._by_sid.pop(member.sid, None)
+        member.sid = sid
+        member.disconnected_at = None
+        member.last_seen = self.clock()
+        self._by_sid[sid] = (session_id, username)
+        self._schedule(member.last_seen + self.heartbeat_timeout, session_id, username)
+
+        partner = self._partner(session_id, username)
+        if partner is None:
+            return username, None, None
+        return username, partner.sid, partner.username
+
+    def expire(self, now=None):
+        """移出心跳超时或重连超时的成员，返回需要通知 partner_left 的伙伴 sid 列表。"""
+        if now is None:
+            now = self.clock()
+
+        notify = []
+        while self._timers and self._timers[0][0] <= now:
+            timer = heapq.heappop(self._timers)
+            if not self._is_live(timer):
+                continue
+            _, _, session_id, username = timer
+            member = self._sessions[session_id][username]
+
+            deadline = self._deadline(member)
+            if deadline > now:
+                # 期间有心跳或重连，按新的截止时间重新检查
+                self._schedule(deadline, session_id, username)
+                continue
+
+            partner = self._partner(session_id, username)
+            self._end(session_id)
+            if partner is not None and partner.sid is not None:
+                notify.append(partner.sid)
+        return notify
+
+    def next_deadline(self):
+        while self._timers and not self._is_live(self._timers[0]):
+            heapq.heappop(self._timers)
+        return self._timers[0][0] if self._timers else None
+
+    def _deadline(self, member):
+        if member.sid is None:
+            return member.disconnected_at + self.grace_period
+        return member.last_seen + self.heartbeat_timeout
+
+    def _schedule(self, deadline, session_id, username):
+        seq = next(self._seq)
+        self._sessions[session_id][username].timer = seq
+        heapq.heappush(self._timers, (deadline, seq, session_id, username))
+
+        # 每个会话最多两条有效记录；旧记录过多时重建堆
+        if len(self._timers) > 4 * len(self._sessions) + 1024:
+            self._timers = [timer for timer in self._timers if self._is_live(timer)]
+            heapq.heapify(self._timers)
+
+    def _is_live(self, timer):
+        _, seq, session_id, username = timer
+        member = self._sessions.get(session_id, {}).get(username)
+        return member is not None and member.timer == seq
+
+    def _member_by_sid(self, sid):
+        entry = self._by_sid.get(sid)
+        if entry is None:
+            return None
+        return self._sessions[entry[0]][entry[1]]
+
+    def _partner(self, session_id, username):
+        for other, member in self._sessions.get(session_id, {}).items():
+            if other != username:
+                return member
+        return None
+
+    def _remove(self, session_id, username):
+        members = self._sessions[session_id]
+        member = members.pop(username)
+        if member.sid is not None:
+            self._by_sid.pop(member.sid, None)
+        if self._by_user.get(username) == session_id:
+            del self._by_user[username]
+        if not members:
+            del self._sessions[session_id]
+
+    def _end(self, session_id):
+        for username in list(self._sessions.get(session_id, ())):
+            self._remove(session_id, username)
+
+
+# Redis 版本：配对双方可能连接在不同 worker 上，会话、心跳截止时间都保存在 Redis 中，
+# 每个操作在 Lua 脚本里原子完成。所有 worker 都运行 expire()，同一个超时只会被处理一次。
+# 成员以 "<session_id>:<用户名>" 标识（session_id 为十六进制，不含冒号）。
+# 每个会话的 resume token 保存在 tokens:<session_id>（用户名 -> token）中。
+_BUDDY_COMMON = """
+local sids, users, timers, sessions = KEYS[1], KEYS[2], KEYS[3], KEYS[4]
+local prefix = ARGV[1]
+
+local function session_key(session_id)
+    return prefix .. 'session:' .. session_id
+end
+
+local function tokens_key(session_id)
+    return prefix .. 'tokens:' .. session_id
+end
+
+local function lookup(sid)
+    local member = redis.call('HGET', sids, sid)
+    if not member then
+        return nil
+    end
+    return string.match(member, '^([^:]+):(.*)$')
+end
+
+local function partner(session_id, username)
+    local fields = redis.call('HGETALL', session_key(session_id))
+    for i = 1, #fields, 2 do
+        if fields[i] ~= username then
+            return fields[i], fields[i + 1]
+        end
+    end
+    return nil
+end
+
+local function remove_member(session_id, username)
+    local key = session_key(session_id)
+    local sid = redis.call('HGET', key, username)
+    if not sid then
+        return
+    end
+    if sid ~= '' then
+        redis.call('HDEL', sids, sid)
+    end
+    redis.call('HDEL', key, username)
+    redis.call('HDEL', tokens_key(session_id), username)
+    if redis.call('HGET', users, username) == session_id then
+        redis.call('HDEL', users, username)
+    end
+    redis.call('ZREM', timers, session_id .. ':' .. username)
+    if redis.call('EXISTS', key) == 0 then
+        redis.call('SREM', sessions, session_id)
+    end
+end
+
+local function end_session(session_id)
+    for _, username in ipairs(redis.call('HKEYS', session_key(session_id))) do
+        remove_member(session_id, username)
+    end
+end
+
+local function leave(sid)
+    local session_id, username = lookup(sid)
+    if not session_id then
+        return false
+    end
+    local _, partner_sid = partner(session_id, username)
+    end_session(session_id)
+    if partner_sid and partner_sid ~= '' then
+        return partner_sid
+    end
+    return false
+end
+"""
+
+_PAIR_SCRIPT = _BUDDY_COMMON + """
+local session_id, deadline = ARGV[2], ARGV[3]
+redis.call('SADD', sessions, session_id)
+for i = 4, #ARGV, 3 do
+    local sid, username, token = ARGV[i], ARGV[i + 1], ARGV[i + 2]
+    leave(sid)
+    redis.call('HSET', session_key(session_id), username, sid)
+    redis.call('HSET', tokens_key(session_id), username, token)
+    redis.call('HSET', sids, sid, session_id .. ':' .. username)
+    redis.call('HSET', users, username, session_id)
+    redis.call('ZADD', timers, deadline, session_id .. ':' .. username)
+end
+return session_id
+"""
+
+_HEARTBEAT_SCRIPT = _BUDDY_COMMON + """
+local member = redis.call('HGET', sids, ARGV[2])
+if not member then
+    return 0
+end
+redis.call('ZADD', timers, ARGV[3], member)
+return 1
+"""
+
+_PARTNER_OF_SCRIPT = _BUDDY_COMMON + """
+local session_id, username = lookup(ARGV[2])
+if not session_id then
+    return false
+end
+local partner_username, partner_sid = partner(session_id, username)
+if not partner_username then
+    return {session_id}
+end
+return {session_id, partner_sid, partner_username}
+"""
+
+_LEAVE_SCRIPT = _BUDDY_COMMON + """
+return leave(ARGV[2])
+"""
+
+_COMPLETE_SCRIPT = _BUDDY_COMMON + """
+local session_id, username = lookup(ARGV[2])
+if not session_id then
+    return false
+end
+local _, partner_sid = partner(session_id, username)
+remove_member(session_id, username)
+if partner_sid and partner_sid ~= '' then
+    return partner_sid
+end
+return false
+"""
+
+_DISCONNECT_SCRIPT = _BUDDY_COMMON + """
+local sid = ARGV[2]
+local session_id, username = lookup(sid)
+if not session_id then
+    return 0
+end
+redis.call('HDEL', sids, sid)
+redis.call('HSET', session_key(session_id), username, '')
+redis.call('ZADD', timers, ARGV[3], session_id .. ':' .. username)
+return 1
+"""
+
+_RESUME_SCRIPT = _BUDDY_COMMON + """
+local sid, session_id, token, deadline = ARGV[2], ARGV[3], ARGV[4], ARGV[5]
+local key = session_key(session_id)
+local username
+local tokens = redis.call('HGETALL', tokens_key(session_id))
+for i = 1, #tokens, 2 do
+    if tokens[i + 1] == token then
+        username = tokens[i]
+    end
+end
+local previous = username and redis.call('HGET', key, username)
+if not previous then
+    return false
+end
+if previous ~= '' then
+    redis.call('HDEL', sids, previous)
+end
+redis.call('HSET', key, username, sid)
+redis.call('HSET', sids, sid, session_id .. ':' .. username)
+redis.call('ZADD', timers, deadline, session_id .. ':' .. username)
+
+local partner_username, partner_sid = partner(session_id, username)
+if not partner_username then
+    return {username}
+end
+return {username, partner_sid, partner_username}
+"""
+
+_EXPIRE_SCRIPT = _BUDDY_COMMON + """
+local expired = redis.call('ZRANGEBYSCORE', timers, '-inf', ARGV[2], 'LIMIT', 0, ARGV[3])
+local notify = {}
+for _, member in ipairs(expired) do
+    local session_id, username = string.match(member, '^([^:]+):(.*)$')
+    -- 同一批里伙伴的记录可能已随会话一起删除
+    if redis.call('HEXISTS', session_key(session_id), username) == 1 then
+        local _, partner_sid = partner(session_id, username)
+        end_session(session_id)
+        if partner_sid and partner_sid ~= '' then
+            table.insert(notify, partner_sid)
+        end
+    else
+        redis.call('ZREM', timers, member)
+    end
+end
+return {#expired, notify}
+"""
+
+
+class RedisBuddyRegistry:
+    """与 BuddyRegistry 接口相同，状态保存在 Redis（或兼容 Redis 的服务）中。"""
+
+    def __init__(
+        self,
+        client,
+        heartbeat_timeout=30,
+        grace_period=30,
+        prefix="focuser:{buddy}:",
+        batch_size=1000,
+        clock=time.time,  # 多个进程/机器之间共享截止时间，不能用 monotonic
+    ):
+        self.client = client
+        self.heartbeat_timeout = heartbeat_timeout
+        self.grace_period = grace_period
+        self.clock = clock
+        self.prefix = prefix
+        self.batch_size = batch_size
+        self._keys = [
+            prefix + "sids",
+            prefix + "users",
+            prefix + "timers",
+            prefix + "sessions",
+        ]
+        self._pair = client.register_script(_PAIR_SCRIPT)
+        self._heartbeat = client.register_script(_HEARTBEAT_SCRIPT)
+        self._partner_of = client.register_script(_PARTNER_OF_SCRIPT)
+        self._leave = client.register_script(_LEAVE_SCRIPT)
+        self._complete = client.register_script(_COMPLETE_SCRIPT)
+        self._disconnect = client.register_script(_DISCONNECT_SCRIPT)
+        self._resume = client.register_script(_RESUME_SCRIPT)
+        self._expire = client.register_script(_EXPIRE_SCRIPT)
+
+    def __len__(self):
+        return self.client.scard(self._keys[3])
+
+    def pair(self, sid, username, partner_sid, partner_username):
+        key = username or sid
+        partner_key = partner_username or partner_sid
+        if partner_key == key:
+            partner_key = partner_sid
+        session_id = uuid.uuid4().hex
+        tokens = new_resume_token(), new_resume_token()
+        self._call(
+            self._pair,
+            session_id,
+            self.clock() + self.heartbeat_timeout,
+            sid,
+            key,
+            tokens[0],
+            partner_sid,
+            partner_key,
+            tokens[1],
+        )
+        return (session_id, *tokens)
+
+    def heartbeat(self, sid):
+        return bool(
+            self._call(self._heartbeat, sid, self.clock() + self.heartbeat_timeout)
+        )
+
+    def partner_of(self, sid):
+        result = self._call(self._partner_of, sid)
+        if not result:
+            return None
+        if len(result) == 1:
+            return result[0], None, None
+        session_id, partner_sid, partner_username = result
+        return session_id, partner_sid or None, partner_username
+
+    def session_of_user(self, username):
+        return self.client.hget(self._keys[1], username)
+
+    def leave(self, sid):
+        return self._call(self._leave, sid)
+
+    def complete(self, sid):
+        return self._call(self._complete, sid)
+
+    def disconnect(self, sid):
+        return bool(self._call(self._disconnect, sid, self.clock() + self.grace_period))
+
+    def resume(self, sid, session_id, resume_token):
+        if not isinstance(session_id, str) or not isinstance(resume_token, str):
+            return None
+        if not session_id or not resume_token:
+            return None
+        result = self._call(
+            self._resume,
+            sid,
+            session_id,
+            resume_token,
+            self.clock() + self.heartbeat_timeout,
+        )
+        if result is None:
+            return None
+        if len(result) == 1:
+            return result[0], None, None
+        username, partner_sid, partner_username = result
+        return username, partner_sid or None, partner_username
+
+    def expire(self, now=None):
+        if now is None:
+            now = self.clock()
+
+        notify = []
+        while True:
+            count, batch = self._call(self._expire, now, self.batch_size)
+            notify.extend(batch)
+            if count < self.batch_size:
+                return notify
+
+    def next_deadline(self):
+        head = self.client.zrange(self._keys[2], 0, 0, withscores=True)
+        return head[0][1] if head else None
+
+    def _call(self, script, *args):
+        return script(keys=self._keys, args=[self.prefix, *args])
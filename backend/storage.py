@@ -0,0 +1,60 @@
+import sqlite3
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.pool import QueuePool
+
+
+def database_url(url):
+    # Heroku / Elastic Beanstalk 等平台仍然提供 postgres:// 前缀，SQLAlchemy 1.4 不再接受
+    if url.startswith("postgres://"):
+        url = "postgresql://" + url[len("postgres://") :]
+    return url
+
+
+def engine_options(url, pool_size=10, max_overflow=20, pool_timeout=30, tuned=True):
+    """根据数据库类型返回 SQLALCHEMY_ENGINE_OPTIONS。
+
+    eventlet 下每个 worker 只有一个 OS 线程，但会同时运行很多 green thread，
+    连接池大小决定了同一 worker 内能并发执行的查询数。
+    """
+    if not tuned:
+        return {}
+
+    backend = make_url(url).get_backend_name()
+    if backend == "sqlite":
+        if make_url(url).database in (None, "", ":memory:"):
+            return {}
+        # SQLAlchemy 1.4 对文件数据库默认使用 NullPool，每次请求都重新打开文件并执行 PRAGMA
+        return {
+            "poolclass": QueuePool,
+            "pool_size": pool_size,
+            "max_overflow": max_overflow,
+            "pool_timeout": pool_timeout,
+            "connect_args": {"check_same_thread": False},
+        }
+
+    return {
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_timeout": pool_timeout,
+        "pool_pre_ping": True,
+        "pool_recycle": 1800,
+    }
+
+
+def enable_sqlite_pragmas(busy_timeout_ms=5000, mmap_size=256 * 1024 * 1024):
+    """为每个新建的 SQLite 连接开启 WAL 等设置，读写互不阻塞，写冲突时等待而不是立即报错。"""
+
+    @event.listens_for(Engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        if not isinstance(dbapi_connection, sqlite3.Connection):
+            return
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={int(busy_timeout_ms)}")
+        cursor.execute(f"PRAGMA mmap_size={int(mmap_size)}")
+        cursor.close()
+
+    return set_sqlite_pragmas